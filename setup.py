@@ -52,7 +52,9 @@ setup(
     include_package_data=True,
     entry_points={
         "console_scripts": [
-            "gtirb-ddisasm-retypd=ddisasm_retypd.ddisasm_retypd:main"
+            "gtirb-ddisasm-retypd=ddisasm_retypd.ddisasm_retypd:main",
+            "gtirb-ddisasm-retypd-batch=ddisasm_retypd.batch:main",
+            "gtirb-ddisasm-retypd-daemon=ddisasm_retypd.daemon:main",
         ]
     },
 )
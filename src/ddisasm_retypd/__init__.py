@@ -20,4 +20,7 @@
 # official endorsement should be inferred.
 
 from .ddisasm_retypd import DdisasmRetypd  # noqa: F401
-from .ddisasm import extract_souffle_relations  # noqa: F401
+from .ddisasm import (  # noqa: F401
+    extract_module_souffle_relations,
+    extract_souffle_relations,
+)
@@ -0,0 +1,272 @@
+# Copyright (C) 2022 GrammaTech, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# This project is sponsored by the Office of Naval Research, One
+# Liberty Center, 875 N. Randolph Street, Arlington, VA 22203 under
+# contract #N68335-17-C-0700.  The content of the information does not
+# necessarily reflect the position or policy of the Government and no
+# official endorsement should be inferred.
+
+import argparse
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+from ddisasm_retypd.ddisasm_retypd import DdisasmRetypd, retype_file
+from ddisasm_retypd.souffle import (
+    compile_souffle,
+    default_jobs,
+    load_souffle_module,
+)
+
+from pathlib import Path
+
+
+# Options shared by every file typed in a batch, set in each worker
+_batch_options: Dict[str, Any] = {}
+
+
+def find_inputs(source: Path) -> List[Path]:
+    """Find the GTIRB files of a batch
+    :param source: Directory of GTIRB files, or a manifest listing one GTIRB
+        file per line. Relative paths in a manifest are relative to it, and
+        blank lines and lines starting with # are ignored.
+    :returns: Paths of the GTIRB files
+    """
+    if source.is_dir():
+        return sorted(source.glob("*.gtirb"))
+
+    inputs = []
+
+    for line in source.read_text().splitlines():
+        line = line.strip()
+
+        if line and not line.startswith("#"):
+            inputs.append(source.parent / line)
+
+    return inputs
+
+
+def output_paths(inputs: List[Path], dest_dir: Path) -> List[Path]:
+    """Get the paths to write the typed GTIRB of each input to, which keep
+        the paths of the inputs relative to the directory they all share, so
+        that inputs with the same name in different directories are not
+        written to the same path
+    :param inputs: GTIRB files to type
+    :param dest_dir: Directory to write typed GTIRB files to
+    :returns: Path to write each input's typed GTIRB to
+    """
+    if not inputs:
+        return []
+
+    resolved = [source.resolve() for source in inputs]
+    root = Path(os.path.commonpath([source.parent for source in resolved]))
+    return [dest_dir / source.relative_to(root) for source in resolved]
+
+
+def warm_souffle(
+    compiled: bool, in_process: bool, cache_dir: Optional[Path] = None
+):
+    """Build the souffle program that typing without a debug directory runs,
+        so that workers find it in the cache instead of each building it
+    :param compiled: Whether a compiled executable is run
+    :param in_process: Whether the program is run in-process through SWIG
+    :param cache_dir: Directory compiled souffle programs are cached in
+    """
+    outputs = list(DdisasmRetypd.SUBTYPE_RELS)
+
+    if in_process:
+        # Loading the module here means forked workers inherit it
+        load_souffle_module(DdisasmRetypd.DATALOG, {}, cache_dir, outputs)
+    elif compiled:
+        compile_souffle(DdisasmRetypd.DATALOG, {}, cache_dir, outputs)
+
+
+def _init_worker(options: Dict[str, Any], log_level: int):
+    """Set up a batch worker process
+    :param options: Options to type every file with
+    :param log_level: Logging level of the worker
+    """
+    _batch_options.update(options)
+    logging.getLogger().setLevel(log_level)
+
+
+def _type_file(paths: Tuple[Path, Path]) -> Dict[str, Any]:
+    """Type a single file of a batch, capturing any failure
+    :param paths: Input GTIRB file and path to write the typed GTIRB to
+    :returns: Summary of typing the file
+    """
+    (source, dest) = paths
+    start = time.perf_counter()
+    summary = {"input": str(source), "output": str(dest)}
+
+    try:
+        types = retype_file(source, dest, **_batch_options)
+        summary.update(status="ok", types=len(types))
+    except Exception as e:
+        logging.exception(f"Failed to type {source}")
+        summary.update(status="error", error=f"{type(e).__name__}: {e}")
+
+    summary["seconds"] = round(time.perf_counter() - start, 3)
+    return summary
+
+
+def run_batch(
+    inputs: List[Path],
+    dest_dir: Path,
+    workers: int = 1,
+    compiled: bool = False,
+    in_process: bool = False,
+    cache_dir: Optional[Path] = None,
+    jobs: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Type many GTIRB files in a pool of worker processes
+    :param inputs: GTIRB files to type
+    :param dest_dir: Directory to write typed GTIRB files to, under their
+        paths relative to the directory the inputs share
+    :param workers: Number of files to type at once
+    :param compiled: Whether or not to compile the souffle program
+    :param in_process: Whether to run the souffle program in-process
+    :param cache_dir: Directory compiled souffle programs are cached in
+    :param jobs: Number of souffle worker threads per file, defaults to
+        sharing the cores between the workers
+    :returns: Summary of each file, in the order of the inputs
+    """
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    warm_souffle(compiled, in_process, cache_dir)
+
+    options = {
+        "compiled": compiled,
+        "in_process": in_process,
+        "cache_dir": cache_dir,
+        "jobs": jobs or max(1, default_jobs() // workers),
+    }
+    paths = list(zip(inputs, output_paths(inputs, dest_dir)))
+
+    for (_, dest) in paths:
+        dest.parent.mkdir(parents=True, exist_ok=True)
+
+    log_level = logging.getLogger().getEffectiveLevel()
+
+    if workers <= 1 or len(paths) <= 1:
+        _init_worker(options, log_level)
+        return [_type_file(path) for path in paths]
+
+    # Forked workers inherit the imported modules and any souffle module
+    # loaded above, rather than each importing them again
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context(
+        "fork" if "fork" in methods else None
+    )
+
+    with context.Pool(
+        workers, initializer=_init_worker, initargs=(options, log_level)
+    ) as pool:
+        return pool.map(_type_file, paths, chunksize=1)
+
+
+def print_summary(summaries: List[Dict[str, Any]]):
+    """Print a table of the status and timing of each file
+    :param summaries: Summaries of the typed files
+    """
+    for summary in summaries:
+        print(
+            f"{summary['status']:<6} {summary['seconds']:9.3f}s  "
+            f"{summary['input']}"
+        )
+
+    failed = sum(summary["status"] != "ok" for summary in summaries)
+    total = sum(summary["seconds"] for summary in summaries)
+    print(
+        f"{len(summaries) - failed} typed, {failed} failed, "
+        f"{total:.3f}s total"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run retypd on many ddisasm-generated GTIRB files"
+    )
+    parser.add_argument(
+        "source",
+        type=Path,
+        help="Directory of GTIRB files, or a manifest listing one per line",
+    )
+    parser.add_argument(
+        "dest_dir", type=Path, help="Directory to write typed GTIRB to"
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=default_jobs(),
+        help="Number of files to type at once (default: all cores)",
+    )
+    parser.add_argument(
+        "-c",
+        "--compiled",
+        action="store_true",
+        help="Run a compiled build of the souffle program",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        help="Directory to cache compiled programs in",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Number of souffle worker threads per file "
+        "(default: cores divided between workers)",
+    )
+    parser.add_argument(
+        "--in-process",
+        action="store_true",
+        help="Run a compiled souffle program in-process through SWIG",
+    )
+    parser.add_argument(
+        "--summary",
+        type=Path,
+        help="Path to write a JSON summary of each file to",
+    )
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.INFO)
+
+    summaries = run_batch(
+        find_inputs(args.source),
+        args.dest_dir,
+        workers=args.workers,
+        compiled=args.compiled,
+        in_process=args.in_process,
+        cache_dir=args.cache_dir,
+        jobs=args.jobs,
+    )
+
+    print_summary(summaries)
+
+    if args.summary is not None:
+        args.summary.write_text(json.dumps(summaries, indent=2))
+
+    if any(summary["status"] != "ok" for summary in summaries):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+# Copyright (C) 2022 GrammaTech, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# This project is sponsored by the Office of Naval Research, One
+# Liberty Center, 875 N. Randolph Street, Arlington, VA 22203 under
+# contract #N68335-17-C-0700.  The content of the information does not
+# necessarily reflect the position or policy of the Government and no
+# official endorsement should be inferred.
+
+import hashlib
+import logging
+import os
+import shutil
+import tarfile
+import tempfile
+
+from ddisasm_retypd.souffle import RelationReader, datalog_hash
+
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Formats extracted facts can be cached in: a directory of facts files, or a
+# compressed archive of them
+FACT_CACHE_FORMATS = ("dir", "tar.gz")
+
+
+def _facts_entry(cache_dir: Path, key: str, fact_format: str) -> Path:
+    """Path of the cache entry of a module's facts
+    :param cache_dir: Cache directory
+    :param key: Key of the facts, as returned by facts_key
+    :param fact_format: Format of the entry, one of FACT_CACHE_FORMATS
+    :returns: Path to the entry
+    """
+    if fact_format == "dir":
+        return cache_dir / "facts" / key
+    elif fact_format == "tar.gz":
+        return cache_dir / "facts" / f"{key}.tar.gz"
+    else:
+        raise ValueError(f"Unknown fact cache format {fact_format}")
+
+
+def load_facts(
+    cache_dir: Path, key: str, directory: Path, fact_format: str = "dir"
+) -> bool:
+    """Copy cached facts into a facts directory
+    :param cache_dir: Cache directory
+    :param key: Key of the facts, as returned by facts_key
+    :param directory: Directory to copy the facts to
+    :param fact_format: Format of the entry, one of FACT_CACHE_FORMATS
+    :returns: Whether the facts were cached
+    """
+    entry = _facts_entry(cache_dir, key, fact_format)
+
+    try:
+        if fact_format == "dir":
+            if not entry.is_dir():
+                return False
+
+            for path in entry.glob("*.facts"):
+                shutil.copyfile(path, directory / path.name)
+        else:
+            with tarfile.open(entry, "r:gz") as archive:
+                for member in archive.getmembers():
+                    # Only the files the cache wrote, without directories, are
+                    # extracted
+                    name = member.name
+                    if member.isfile() and name == Path(name).name:
+                        archive.extract(member, directory)
+    except FileNotFoundError:
+        return False
+    except (OSError, tarfile.TarError) as e:
+        logging.warning(f"Ignoring unreadable cached facts {entry}: {e}")
+        return False
+
+    logging.debug(f"Using cached facts {entry}")
+    return True
+
+
+def store_facts(
+    cache_dir: Path, key: str, directory: Path, fact_format: str = "dir"
+):
+    """Store the facts of a facts directory in the cache, atomically so that
+        concurrent processes never observe a partial entry
+    :param cache_dir: Cache directory
+    :param key: Key of the facts, as returned by facts_key
+    :param directory: Directory of the extracted facts
+    :param fact_format: Format of the entry, one of FACT_CACHE_FORMATS
+    """
+    entry = _facts_entry(cache_dir, key, fact_format)
+    entry.parent.mkdir(parents=True, exist_ok=True)
+    paths = sorted(directory.glob("*.facts"))
+
+    if fact_format == "dir":
+        tmpdir = tempfile.mkdtemp(dir=entry.parent)
+
+        for path in paths:
+            shutil.copyfile(path, Path(tmpdir) / path.name)
+
+        try:
+            os.replace(tmpdir, entry)
+        except OSError:
+            # Another process stored the same facts first
+            shutil.rmtree(tmpdir)
+    else:
+        with tempfile.NamedTemporaryFile(
+            dir=entry.parent, delete=False
+        ) as f:
+            with tarfile.open(fileobj=f, mode="w:gz") as archive:
+                for path in paths:
+                    archive.add(path, arcname=path.name)
+
+        os.replace(f.name, entry)
+
+
+def outputs_key(facts_key: str, datalog: Path, output_rels: List[str]) -> str:
+    """Compute the cache key of the outputs of souffle on a module's facts,
+        which are determined by the facts, the datalog program and the
+        relations output
+    :param facts_key: Key of the facts, as returned by facts_key
+    :param datalog: Path to the datalog file
+    :param output_rels: Relations output
+    :returns: Hex digest of the outputs
+    """
+    digest = hashlib.sha256()
+    digest.update(f"facts\0{facts_key}\0".encode())
+
+    # The outputs of the program do not depend on the souffle version or on
+    # whether it is compiled
+    digest.update(f"datalog\0{datalog_hash(datalog, {}, '')}\0".encode())
+
+    for rel in sorted(output_rels):
+        digest.update(f"output\0{rel}\0".encode())
+
+    return digest.hexdigest()
+
+
+def load_outputs(
+    cache_dir: Path, key: str
+) -> Optional[Dict[str, RelationReader]]:
+    """Load the cached outputs of souffle on a module's facts
+    :param cache_dir: Cache directory
+    :param key: Key of the outputs, as returned by outputs_key
+    :returns: Mapping of relations to readers of their rows in the cache, or
+        None if they are not cached
+    """
+    entry = cache_dir / "outputs" / key
+
+    if not entry.is_dir():
+        return None
+
+    logging.debug(f"Using cached outputs {entry}")
+    return {path.stem: RelationReader(path) for path in entry.glob("*.csv")}
+
+
+def store_outputs(
+    cache_dir: Path,
+    key: str,
+    outputs: Dict[str, Iterable[Tuple[str, ...]]],
+) -> Dict[str, RelationReader]:
+    """Store the outputs of souffle on a module's facts in the cache,
+        atomically so that concurrent processes never observe a partial entry.
+        The output file of a relation read by a RelationReader is copied, and
+        the rows of any other relation are written as they are iterated, so
+        the rows are never all held in memory.
+    :param cache_dir: Cache directory
+    :param key: Key of the outputs, as returned by outputs_key
+    :param outputs: Mapping of relations to their rows
+    :returns: Mapping of relations to readers of their rows in the cache
+    """
+    entry = cache_dir / "outputs" / key
+    entry.parent.mkdir(parents=True, exist_ok=True)
+    tmpdir = Path(tempfile.mkdtemp(dir=entry.parent))
+
+    for (rel, rows) in outputs.items():
+        path = tmpdir / f"{rel}.csv"
+
+        if isinstance(rows, RelationReader):
+            shutil.copyfile(rows.path, path)
+        else:
+            with open(path, "w") as f:
+                for row in rows:
+                    f.write("\t".join(row) + "\n")
+
+    try:
+        os.replace(tmpdir, entry)
+    except OSError:
+        # Another process stored the same outputs first
+        shutil.rmtree(tmpdir)
+
+    return load_outputs(cache_dir, key)
@@ -0,0 +1,545 @@
+# Copyright (C) 2022 GrammaTech, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# This project is sponsored by the Office of Naval Research, One
+# Liberty Center, 875 N. Randolph Street, Arlington, VA 22203 under
+# contract #N68335-17-C-0700.  The content of the information does not
+# necessarily reflect the position or policy of the Government and no
+# official endorsement should be inferred.
+
+import argparse
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing.connection import Connection, wait
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import logging
+import math
+import multiprocessing
+import os
+import queue
+import signal
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+
+from ddisasm_retypd.batch import warm_souffle
+from ddisasm_retypd.ddisasm_retypd import retype_file
+from ddisasm_retypd.souffle import default_jobs
+
+from pathlib import Path
+
+
+class QueueFull(RuntimeError):
+    """Raised when a request arrives while every worker and queue slot of the
+    service is taken
+    """
+
+
+def _type_in_child(
+    conn: Connection, source: Path, dest: Path, options: Dict[str, Any]
+):
+    """Type a file in a forked child, and send its summary to the supervisor
+    :param conn: Connection to send the summary over
+    :param source: GTIRB file to type
+    :param dest: Path to write the typed GTIRB to
+    :param options: Other arguments of retype_file
+    """
+    # Lead a process group of its own, so that the processes it starts are
+    # killed along with it
+    os.setsid()
+
+    try:
+        types = retype_file(source, dest, **options)
+        conn.send({"status": "ok", "types": len(types)})
+    except Exception as e:
+        logging.exception(f"Failed to type {source}")
+        conn.send({"status": "error", "error": f"{type(e).__name__}: {e}"})
+    finally:
+        conn.close()
+
+
+def _kill_worker(pid: int):
+    """Kill a worker and the processes it started, and wait for it to exit
+    :param pid: Process ID of the worker
+    """
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+    # The worker may not have started its process group yet
+    try:
+        os.kill(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+    os.waitpid(pid, 0)
+
+
+def _supervise(
+    slots: List[Connection],
+    parent_slots: List[Connection],
+    options: Dict[str, Any],
+):
+    """Fork a worker for each request sent over a slot, and send its summary
+    back over the slot. This process has a single thread, so it can fork
+    workers safely while the server handles requests in threads.
+    :param slots: Connections requests are received over, one per worker
+    :param parent_slots: The server's ends of the slots, to be closed here
+    :param options: Arguments of retype_file for every request
+    """
+    for conn in parent_slots:
+        conn.close()
+
+    # Exit through the cleanup below when the server terminates this process
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    slots = list(slots)
+    # Slot, process ID, deadline and start time of each worker's connection
+    running: Dict[Connection, Tuple[Connection, int, float, float]] = {}
+
+    def finish(conn: Connection, summary: Dict[str, Any]):
+        (slot, pid, _, start) = running.pop(conn)
+        _kill_worker(pid)
+        conn.close()
+        summary["seconds"] = round(time.perf_counter() - start, 3)
+
+        try:
+            slot.send(summary)
+        except OSError:
+            # The server closed the slot while the worker ran
+            pass
+
+    try:
+        while slots:
+            deadlines = [deadline for (_, _, deadline, _) in running.values()]
+            timeout = (
+                max(0, min(deadlines) - time.monotonic())
+                if deadlines
+                else None
+            )
+
+            for conn in wait(slots + list(running), timeout):
+                if conn in running:
+                    try:
+                        summary = conn.recv()
+                    except EOFError:
+                        summary = {"status": "error", "error": "Worker exited"}
+                    finish(conn, summary)
+                    continue
+
+                try:
+                    (source, dest, seconds) = conn.recv()
+                except EOFError:
+                    # The server closed the slot
+                    slots.remove(conn)
+                    continue
+
+                (reader, writer) = multiprocessing.Pipe(duplex=False)
+                start = time.perf_counter()
+                pid = os.fork()
+
+                if pid == 0:
+                    try:
+                        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                        reader.close()
+                        for slot in slots:
+                            slot.close()
+                        _type_in_child(writer, source, dest, options)
+                    finally:
+                        os._exit(0)
+
+                writer.close()
+                running[reader] = (
+                    conn,
+                    pid,
+                    time.monotonic() + seconds,
+                    start,
+                )
+
+            now = time.monotonic()
+            for (conn, (_, _, deadline, _)) in list(running.items()):
+                if deadline <= now:
+                    finish(conn, {"status": "timeout"})
+    finally:
+        for (_, pid, _, _) in running.values():
+            _kill_worker(pid)
+
+
+class TypingService:
+    """Type GTIRB files on a bounded number of worker processes. Each request
+    runs in a process forked from a supervisor, which is itself forked from
+    this process when the service is created. Workers start with the modules
+    and souffle program already loaded, and can be killed when they time out.
+    The supervisor has a single thread, so the service must be created before
+    the server starts handling requests in threads.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        max_queue: int,
+        timeout: float,
+        options: Dict[str, Any],
+    ):
+        """Create a typing service, and fork its supervisor
+        :param workers: Number of files to type at once
+        :param max_queue: Number of requests that may wait for a worker
+            before further requests are turned away
+        :param timeout: Default seconds a request may take, including the
+            time it waits for a worker
+        :param options: Arguments of retype_file for every request
+        """
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.options = options
+        self._lock = threading.Lock()
+        self._accepted = 0
+
+        context = multiprocessing.get_context("fork")
+        pipes = [context.Pipe() for _ in range(workers)]
+        self._conns = [parent for (parent, _) in pipes]
+        self._supervisor = context.Process(
+            target=_supervise,
+            args=([child for (_, child) in pipes], self._conns, options),
+            daemon=True,
+        )
+        self._supervisor.start()
+
+        # Each free slot of the supervisor is a connection in this queue
+        self._slots: "queue.Queue[Connection]" = queue.Queue()
+        for (parent, child) in pipes:
+            child.close()
+            self._slots.put(parent)
+
+    def close(self):
+        """Stop the supervisor, killing any workers still typing files"""
+        for conn in self._conns:
+            conn.close()
+        self._supervisor.join()
+
+    def status(self) -> Dict[str, int]:
+        """Get the load of the service
+        :returns: Number of workers, queue size and accepted requests
+        """
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "accepted": self._accepted,
+            }
+
+    def submit(
+        self, source: Path, dest: Path, timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """Type a GTIRB file, waiting for a free worker if needed
+        :param source: GTIRB file to type
+        :param dest: Path to write the typed GTIRB to
+        :param timeout: Seconds the request may take, or the service default
+        :returns: Summary of typing the file
+        :raises QueueFull: If every worker and queue slot is taken
+        :raises TimeoutError: If the request did not finish in time
+        """
+        deadline = time.monotonic() + (
+            self.timeout if timeout is None else timeout
+        )
+
+        with self._lock:
+            if self._accepted >= self.workers + self.max_queue:
+                raise QueueFull("Every worker and queue slot is taken")
+            self._accepted += 1
+
+        try:
+            try:
+                slot = self._slots.get(
+                    timeout=max(0, deadline - time.monotonic())
+                )
+            except queue.Empty:
+                raise TimeoutError(f"Timed out waiting to type {source}")
+
+            try:
+                slot.send(
+                    (source, dest, max(0, deadline - time.monotonic()))
+                )
+                summary = slot.recv()
+            except EOFError:
+                summary = {"status": "error", "error": "Supervisor exited"}
+            finally:
+                self._slots.put(slot)
+        finally:
+            with self._lock:
+                self._accepted -= 1
+
+        if summary["status"] == "timeout":
+            raise TimeoutError(f"Timed out typing {source}")
+
+        return summary
+
+
+def _parse_timeout(value: Any) -> Optional[float]:
+    """Parse the timeout of a request
+    :param value: Timeout of the request as a number or string, if it has one
+    :returns: Seconds the request may take, or None for the default
+    :raises ValueError: If the timeout is not a finite, non-negative number
+    """
+    if value is None:
+        return None
+
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"Invalid timeout {value!r}")
+
+    timeout = float(value)
+
+    if not math.isfinite(timeout) or timeout < 0:
+        raise ValueError(f"Invalid timeout {value!r}")
+
+    return timeout
+
+
+class TypingRequestHandler(BaseHTTPRequestHandler):
+    """HTTP API of a typing service
+
+    ``GET /status`` returns the load of the service as JSON.
+
+    ``POST /type`` with a JSON body of ``{"input": ..., "output": ...}`` types
+    the GTIRB file at the input path, writes it to the output path and
+    returns a JSON summary. With an ``application/octet-stream`` body, the
+    body is typed as a GTIRB file and the typed GTIRB is returned. Either may
+    set a ``timeout`` in seconds, as a JSON member or a ``X-Timeout`` header.
+    """
+
+    server: "TypingServerMixin"
+
+    def address_string(self) -> str:
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else "local"
+
+    def _send(
+        self,
+        status: HTTPStatus,
+        body: bytes,
+        content_type: str = "application/json",
+    ):
+        """Send a complete response
+        :param status: Status of the response
+        :param body: Body of the response
+        :param content_type: Content type of the body
+        """
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: HTTPStatus, data: Dict[str, Any]):
+        """Send a JSON response
+        :param status: Status of the response
+        :param data: Data to encode as the body of the response
+        """
+        self._send(status, json.dumps(data).encode())
+
+    def do_GET(self):
+        if self.path == "/status":
+            self._send_json(HTTPStatus.OK, self.server.service.status())
+        else:
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": "Not found"})
+
+    def do_POST(self):
+        if self.path != "/type":
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": "Not found"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            if length < 0:
+                raise ValueError(f"Invalid Content-Length {length}")
+
+            body = self.rfile.read(length)
+            timeout = _parse_timeout(self.headers.get("X-Timeout"))
+
+            if self.headers.get_content_type() == "application/octet-stream":
+                self._type_bytes(body, timeout)
+            else:
+                request = json.loads(body)
+                if "timeout" in request:
+                    timeout = _parse_timeout(request["timeout"])
+
+                self._type_path(
+                    Path(request["input"]), Path(request["output"]), timeout
+                )
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": str(e)})
+        except QueueFull as e:
+            self._send_json(HTTPStatus.SERVICE_UNAVAILABLE, {"error": str(e)})
+        except TimeoutError as e:
+            self._send_json(HTTPStatus.GATEWAY_TIMEOUT, {"error": str(e)})
+
+    def _type_path(self, source: Path, dest: Path, timeout: Optional[float]):
+        """Type a GTIRB file named by a request, and send its summary
+        :param source: GTIRB file to type
+        :param dest: Path to write the typed GTIRB to
+        :param timeout: Seconds the request may take, or the default
+        """
+        summary = self.server.service.submit(source, dest, timeout)
+        status = (
+            HTTPStatus.OK
+            if summary["status"] == "ok"
+            else HTTPStatus.INTERNAL_SERVER_ERROR
+        )
+        self._send_json(status, summary)
+
+    def _type_bytes(self, body: bytes, timeout: Optional[float]):
+        """Type a GTIRB file sent in a request, and send the typed GTIRB back
+        :param body: Serialized GTIRB to type
+        :param timeout: Seconds the request may take, or the default
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            source = Path(tmpdir) / "input.gtirb"
+            dest = Path(tmpdir) / "output.gtirb"
+            source.write_bytes(body)
+
+            summary = self.server.service.submit(source, dest, timeout)
+
+            if summary["status"] != "ok":
+                self._send_json(HTTPStatus.INTERNAL_SERVER_ERROR, summary)
+            else:
+                self._send(
+                    HTTPStatus.OK,
+                    dest.read_bytes(),
+                    "application/octet-stream",
+                )
+
+
+class TypingServerMixin:
+    """Server which handles each request in a thread, with a shared service"""
+
+    daemon_threads = True
+    service: TypingService
+
+
+class TypingHTTPServer(TypingServerMixin, ThreadingHTTPServer):
+    """Typing server listening on a TCP port"""
+
+
+class TypingUnixServer(
+    TypingServerMixin,
+    socketserver.ThreadingMixIn,
+    socketserver.UnixStreamServer,
+):
+    """Typing server listening on a Unix socket"""
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve retypd typing of ddisasm-generated GTIRB files"
+    )
+    listen = parser.add_mutually_exclusive_group()
+    listen.add_argument(
+        "--port",
+        type=int,
+        default=8765,
+        help="Local TCP port to listen on (default: 8765)",
+    )
+    listen.add_argument(
+        "--socket", type=Path, help="Unix socket to listen on instead"
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=default_jobs(),
+        help="Number of files to type at once (default: all cores)",
+    )
+    parser.add_argument(
+        "--max-queue",
+        type=int,
+        default=16,
+        help="Number of requests that may wait for a worker (default: 16)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=600,
+        help="Default seconds a request may take (default: 600)",
+    )
+    parser.add_argument(
+        "-c",
+        "--compiled",
+        action="store_true",
+        help="Run a compiled build of the souffle program",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        help="Directory to cache compiled programs in",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Number of souffle worker threads per file "
+        "(default: cores divided between workers)",
+    )
+    parser.add_argument(
+        "--in-process",
+        action="store_true",
+        help="Run a compiled souffle program in-process through SWIG",
+    )
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.INFO)
+
+    warm_souffle(args.compiled, args.in_process, args.cache_dir)
+
+    service = TypingService(
+        args.workers,
+        args.max_queue,
+        args.timeout,
+        {
+            "compiled": args.compiled,
+            "in_process": args.in_process,
+            "cache_dir": args.cache_dir,
+            "jobs": args.jobs or max(1, default_jobs() // args.workers),
+        },
+    )
+
+    if args.socket is not None:
+        server = TypingUnixServer(str(args.socket), TypingRequestHandler)
+        logging.info(f"Listening on {args.socket}")
+    else:
+        server = TypingHTTPServer(
+            ("127.0.0.1", args.port), TypingRequestHandler
+        )
+        logging.info(f"Listening on http://127.0.0.1:{args.port}")
+
+    server.service = service
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+        if args.socket is not None:
+            args.socket.unlink()
+
+
+if __name__ == "__main__":
+    main()
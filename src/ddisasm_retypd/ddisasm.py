@@ -19,14 +19,19 @@
 # necessarily reflect the position or policy of the Government and no
 # official endorsement should be inferred.
 
+import collections
+import contextlib
 import csv
 import gtirb
+import hashlib
 import logging
+import multiprocessing
 
+from ddisasm_retypd.version import __version__
 from gtirb_capstone.instructions import GtirbInstructionDecoder
 from gtirb_functions import Function
 from pathlib import Path
-from typing import Dict, Set, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 
 def filter_name(function: Function) -> str:
@@ -43,21 +48,145 @@ def filter_name(function: Function) -> str:
         return name
 
 
-def get_callgraph(ir: gtirb.IR) -> Dict[str, Set[str]]:
-    """Get the callgraph of the GTIRB IR
+# Prefix of the names of sections holding stubs through which a module calls
+# functions of other modules
+STUB_SECTION_PREFIX = ".plt"
+
+
+def _is_stub(function: Function) -> bool:
+    """Whether a function is a stub through which its module calls another
+    :param function: Function to check
+    :returns: True if every block of the function is in a stub section
+    """
+    return all(
+        block.section is not None
+        and block.section.name.startswith(STUB_SECTION_PREFIX)
+        for block in function.get_all_blocks()
+    )
+
+
+def _local_names(function: Function) -> Set[str]:
+    """Names a function may be referred to by in the facts of its module
+    :param function: Function to get the names of
+    :returns: Its names, and the name it is filtered to
+    """
+    return {*function.names, function.get_name(), filter_name(function)}
+
+
+def get_function_names(ir: gtirb.IR) -> List[Dict[str, str]]:
+    """Get the name of each function in the analysis of the whole IR. A
+        function keeps its filtered name, unless a function of another module
+        has the same filtered name, in which case it is prefixed with the
+        name of its module.
+    :param ir: GTIRB IR to get the function names of
+    :returns: For each module, the name of each function in the IR by the
+        names it has in the module
+    """
+    functions = [Function.build_functions(module) for module in ir.modules]
+    counts = collections.Counter(
+        filter_name(function)
+        for module_functions in functions
+        for function in module_functions
+    )
+    names = []
+
+    for (module, module_functions) in zip(ir.modules, functions):
+        module_names = {}
+
+        for function in module_functions:
+            name = filter_name(function)
+
+            if counts[name] > 1:
+                name = f"{module.name}:{name}"
+
+            for local_name in _local_names(function):
+                module_names[local_name] = name
+
+        names.append(module_names)
+
+    return names
+
+
+def get_stub_links(
+    ir: gtirb.IR, names: List[Dict[str, str]]
+) -> List[Dict[str, str]]:
+    """Link stubs, such as PLT entries, to the functions of other modules
+        they jump to, through the symbols referring to the targets of their
+        jumps. Callers of a linked stub are treated as calling its target.
+    :param ir: GTIRB IR to link the stubs of
+    :param names: Names of the functions of each module, as returned by
+        get_function_names
+    :returns: For each module, the name in the IR of the function each of
+        its linked stubs jumps to, by the names the stub has in the module
+    """
+    # Function defining each symbol, by the first module to define it
+    exports: Dict[str, Tuple[int, str]] = {}
+    stub_blocks: Dict[gtirb.CodeBlock, Tuple[int, Function]] = {}
+
+    for (index, module) in enumerate(ir.modules):
+        for function in Function.build_functions(module):
+            if _is_stub(function):
+                for block in function.get_all_blocks():
+                    stub_blocks[block] = (index, function)
+            else:
+                name = names[index][filter_name(function)]
+
+                for symbol in function.names:
+                    exports.setdefault(symbol, (index, name))
+
+    links: List[Dict[str, str]] = [{} for _ in ir.modules]
+
+    for (block, (index, function)) in stub_blocks.items():
+        for edge in block.outgoing_edges:
+            if edge.label.type != gtirb.Edge.Type.Branch or not isinstance(
+                edge.target, gtirb.ProxyBlock
+            ):
+                continue
+
+            for symbol in edge.target.references:
+                export = exports.get(symbol.name)
+
+                # Only functions of other modules are linked to
+                if export is not None and export[0] != index:
+                    for local_name in _local_names(function):
+                        links[index][local_name] = export[1]
+                    break
+
+    return links
+
+
+def get_callgraph(
+    ir: gtirb.IR,
+    names: Optional[List[Dict[str, str]]] = None,
+    links: Optional[List[Dict[str, str]]] = None,
+) -> Dict[str, Set[str]]:
+    """Get the callgraph of the GTIRB IR, across all of its modules
     :param ir: GTIRB IR to get call graph of
+    :param names: Names of the functions of each module, as returned by
+        get_function_names, which are found if not given
+    :param links: Linked stubs of each module, as returned by get_stub_links,
+        which are found if not given
     :returns: Map of call graphs
     """
-    m = ir.modules[0]
+    if names is None:
+        names = get_function_names(ir)
+
+    if links is None:
+        links = get_stub_links(ir, names)
 
     block_to_func = {}
     callgraph = {}
 
-    for function in Function.build_functions(m):
-        callgraph[filter_name(function)] = set()
+    for (module, module_names, module_links) in zip(
+        ir.modules, names, links
+    ):
+        for function in Function.build_functions(module):
+            local_name = filter_name(function)
+            name = module_links.get(local_name, module_names[local_name])
+            callgraph.setdefault(name, set())
 
-        for block in function.get_all_blocks():
-            block_to_func[block] = function
+            for block in function.get_all_blocks():
+                block_to_func[block] = name
 
     for edge in ir.cfg:
         if edge.label.type == gtirb.Edge.Type.Call:
@@ -67,10 +196,8 @@ def get_callgraph(ir: gtirb.IR) -> Dict[str, Set[str]]:
                 and edge.source in block_to_func
                 and edge.target in block_to_func
             ):
-                caller_func = block_to_func[edge.source]
-                callee_func = block_to_func[edge.target]
-                caller_name = filter_name(caller_func)
-                callee_name = filter_name(callee_func)
+                caller_name = block_to_func[edge.source]
+                callee_name = block_to_func[edge.target]
                 callgraph[caller_name].add(callee_name)
 
     return callgraph
@@ -100,102 +227,482 @@ def get_arch_sizes(module: gtirb.Module) -> Tuple[int, int]:
         raise NotImplementedError()
 
 
+# Size of the slices fact blobs are written to files in
+FACT_BLOB_CHUNK = 1 << 20
+
+
+def _write_fact_blobs(aux_data: gtirb.AuxData, directory: Path):
+    """Write each of the blobs of ddisasm facts in an AuxData to a facts file
+    :param aux_data: souffleFacts or souffleOutputs AuxData
+    :param directory: Directory to write souffle facts to
+    """
+    for (name, (header, text)) in aux_data.data.items():
+        logging.debug(f"Writing {name} of {header}")
+
+        # Encode in slices rather than encoding a copy of the whole blob
+        with open(directory / f"{name}.facts", "w") as f:
+            for pos in range(0, len(text), FACT_BLOB_CHUNK):
+                f.write(text[pos : pos + FACT_BLOB_CHUNK])
+
+
+# AuxData tables facts are extracted from
+FACT_AUX_DATA = ("souffleFacts", "souffleOutputs")
+
+
+def facts_key(module: gtirb.Module) -> str:
+    """Compute the cache key of the facts extracted from a module, which is a
+        hash of the code that extracts them and of everything it reads: the
+        module's ISA, the bytes and CFG edges of its code blocks and ddisasm's
+        facts. Other AuxData, such as types, does not change the facts.
+    :param module: Module to compute the key of
+    :returns: Hex digest of the module's facts
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{__version__}\0{module.isa.name}\0".encode())
+
+    # Changing the extraction changes the facts even if the version is not
+    # bumped, so its source is hashed as well
+    digest.update(Path(__file__).read_bytes())
+
+    for block in sorted(module.code_blocks, key=_block_order):
+        digest.update(f"block\0{block.address}\0{block.size}\0".encode())
+        digest.update(bytes(block.contents))
+
+        # Edges and the symbols of proxy blocks are unordered, so they are
+        # sorted for the key to be the same on every load of the module
+        edges = []
+
+        for edge in block.outgoing_edges:
+            if isinstance(edge.target, gtirb.CodeBlock):
+                target = str(edge.target.address)
+            else:
+                target = ",".join(
+                    sorted(symbol.name for symbol in edge.target.references)
+                )
+
+            edges.append(
+                f"edge\0{target}\0{edge.label.type.name}\0"
+                f"{edge.label.conditional}\0{edge.label.direct}\0"
+            )
+
+        for edge in sorted(edges):
+            digest.update(edge.encode())
+
+    for name in FACT_AUX_DATA:
+        aux_data = module.aux_data.get(name)
+
+        if aux_data is None:
+            continue
+
+        digest.update(f"aux\0{name}\0{aux_data.type_name}\0".encode())
+
+        # Relations are hashed by name, so that the key does not depend on
+        # the order the mapping was built in
+        for (rel, (header, text)) in sorted(aux_data.data.items()):
+            digest.update(f"{rel}\0{header}\0{len(text)}\0".encode())
+
+            for pos in range(0, len(text), FACT_BLOB_CHUNK):
+                digest.update(text[pos : pos + FACT_BLOB_CHUNK].encode())
+
+    return digest.hexdigest()
+
+
+def extract_module_souffle_relations(
+    module: gtirb.Module, directory: Path
+):
+    """Write souffle facts and outputs of a module to a directory as facts
+    :param module: gtirb.Module to read souffle facts from
+    :param directory: Directory to write souffle facts to
+    """
+    for name in FACT_AUX_DATA:
+        _write_fact_blobs(module.aux_data[name], directory)
+
+
 def extract_souffle_relations(ir: gtirb.IR, directory: Path):
     """Write souffle facts and outputs to a directory as facts
-    :param ir: gtirb.IR to read souffle facts from
+    :param ir: gtirb.IR to read souffle facts from, which are those of its
+        first module. Use extract_module_souffle_relations for the facts of
+        each module of an IR with several.
     :param directory: Directory to write souffle facts to
     """
-    module = ir.modules[0]
-    facts = module.aux_data["souffleFacts"].data
-    outputs = module.aux_data["souffleOutputs"].data
-
-    for (name, data) in facts.items():
-        header, text = data
-        logging.debug(f"Writing {name} of {header}")
-        (directory / f"{name}.facts").write_text(text)
-    for (name, data) in outputs.items():
-        header, text = data
-        logging.debug(f"Writing {name} of {header}")
-        (directory / f"{name}.facts").write_text(text)
+    extract_module_souffle_relations(ir.modules[0], directory)
 
 
 csv.register_dialect("souffle", delimiter="\t", quoting=csv.QUOTE_NONE)
 
 
-def extract_instruction_relations(ir: gtirb.IR, directory: Path):
-    """Write souffle facts about instruction in the CFG for a GTIRB IR
-    :param ir: IR that is being loaded
-    :param directory: Directory to output facts to
+class FactWriter:
+    """Write the rows of a souffle facts file as they are generated, holding
+    at most a bounded number of rows in memory
     """
+
+    # Number of rows buffered before they are written out
+    BUFFER_ROWS = 4096
+
+    def __init__(self, path: Path, buffer_rows: int = BUFFER_ROWS):
+        self.file = open(path, "w")
+        self.writer = csv.writer(self.file, "souffle")
+        self.buffer_rows = buffer_rows
+        self.buffer: List[Tuple] = []
+
+    def __enter__(self) -> "FactWriter":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, row: Tuple):
+        """Write a single row
+        :param row: Row to write
+        """
+        self.buffer.append(row)
+
+        if len(self.buffer) >= self.buffer_rows:
+            self.flush()
+
+    def write_rows(self, rows: Iterable[Tuple]):
+        """Write many rows
+        :param rows: Rows to write
+        """
+        for row in rows:
+            self.write(row)
+
+    def flush(self):
+        """Write out the buffered rows"""
+        self.writer.writerows(self.buffer)
+        self.buffer.clear()
+
+    def close(self):
+        """Write out the buffered rows and close the file"""
+        self.flush()
+        self.file.close()
+
+
+# Minimum number of code blocks for which decoding is split across processes,
+# below this the cost of starting the workers outweighs the gain.
+PARALLEL_DECODE_MIN_BLOCKS = 2048
+
+# Maximum number of code blocks decoded in a chunk, which bounds the number of
+# rows held in memory before they are written
+DECODE_CHUNK_BLOCKS = 1024
+
+# Code blocks to decode, in output order. This is set before the decoding
+# worker processes are forked so that they inherit it rather than having the
+# IR sent to them.
+_decode_blocks: List[Tuple[gtirb.Module.ISA, gtirb.CodeBlock]] = []
+
+InstructionRows = Tuple[
+    List[Tuple[int, int]], List[Tuple[int, str]], List[Tuple[int, str]]
+]
+
+
+def _block_order(block: gtirb.CodeBlock) -> Tuple[int, int, int]:
+    """Key to order code blocks deterministically
+    :param block: Code block to get the key of
+    :returns: Sort key of the block
+    """
+    return (block.address or 0, block.size, block.uuid.int)
+
+
+def _decode_range(bounds: Tuple[int, int]) -> InstructionRows:
+    """Decode a range of the blocks to decode into instruction fact rows
+    :param bounds: Start and end index of the range of blocks
+    :returns: Rows of block_instruction, instruction_read_access and
+        instruction_write_access
+    """
+    start, end = bounds
+    decoders: Dict[gtirb.Module.ISA, GtirbInstructionDecoder] = {}
+    reg_names: Dict[Tuple[gtirb.Module.ISA, int], str] = {}
+
     block_instruction = []
     instruction_read_access = []
     instruction_write_access = []
 
-    for module in ir.modules:
-        decoder = GtirbInstructionDecoder(module.isa)
+    for (isa, block) in _decode_blocks[start:end]:
+        if isa not in decoders:
+            decoders[isa] = GtirbInstructionDecoder(isa)
 
-        for block in module.code_blocks:
-            for instr in decoder.get_instructions(block):
-                block_instruction.append((instr.address, block.address))
-                regs_read, regs_write = instr.regs_access()
-
-                # Unfortunately our register indices aren't lining up with the
-                # ones that ddisasm is producing, so we generate this
-                # constraint by register name
-                instruction_read_access += [
-                    (instr.address, instr.reg_name(reg_read).upper())
-                    for reg_read in regs_read
-                ]
-                instruction_write_access += [
-                    (instr.address, instr.reg_name(reg_write).upper())
-                    for reg_write in regs_write
-                ]
-
-    with open(directory / "block_instruction.facts", "w") as f:
-        csv.writer(f, "souffle").writerows(block_instruction)
-
-    with open(directory / "instruction_read_access.facts", "w") as f:
-        csv.writer(f, "souffle").writerows(instruction_read_access)
-
-    with open(directory / "instruction_write_access.facts", "w") as f:
-        csv.writer(f, "souffle").writerows(instruction_write_access)
-
-
-def extract_block_relations(ir: gtirb.IR, directory: Path):
-    """Write souffle facts about blocks in the CFG for a GTIRB IR
-    :param ir: IR that is being loaded
+        for instr in decoders[isa].get_instructions(block):
+            block_instruction.append((instr.address, block.address))
+            regs_read, regs_write = instr.regs_access()
+
+            # Unfortunately our register indices aren't lining up with the
+            # ones that ddisasm is producing, so we generate this constraint
+            # by register name
+            for (regs, rows) in (
+                (regs_read, instruction_read_access),
+                (regs_write, instruction_write_access),
+            ):
+                for reg in regs:
+                    name = reg_names.get((isa, reg))
+
+                    if name is None:
+                        name = instr.reg_name(reg).upper()
+                        reg_names[(isa, reg)] = name
+
+                    rows.append((instr.address, name))
+
+    return (
+        block_instruction,
+        instruction_read_access,
+        instruction_write_access,
+    )
+
+
+def extract_instruction_relations(
+    module: gtirb.Module, directory: Path, jobs: int = 1
+):
+    """Write souffle facts about instruction in the CFG for a GTIRB module
+    :param module: Module that is being loaded
     :param directory: Directory to output facts to
+    :param jobs: Number of processes to decode instructions with. Rows are
+        written in the same order regardless of the number of processes.
     """
-    blocks = []
-
-    for module in ir.modules:
-        if not any(module.code_blocks):
-            return
+    _decode_blocks[:] = [
+        (module.isa, block)
+        for block in sorted(module.code_blocks, key=_block_order)
+    ]
+
+    # Split the blocks in more chunks than workers to balance the load
+    count = len(_decode_blocks)
+    chunk_size = max(1, min(-(-count // (jobs * 4)), DECODE_CHUNK_BLOCKS))
+    chunks = [
+        (start, min(start + chunk_size, count))
+        for start in range(0, count, chunk_size)
+    ]
+
+    # Daemonic processes, such as the workers of a batch, cannot have
+    # children, so they always decode serially
+    parallel = (
+        jobs > 1
+        and count >= PARALLEL_DECODE_MIN_BLOCKS
+        and "fork" in multiprocessing.get_all_start_methods()
+        and not multiprocessing.current_process().daemon
+    )
+
+    with contextlib.ExitStack() as stack:
+        stack.callback(_decode_blocks.clear)
+        writers = [
+            stack.enter_context(FactWriter(directory / name))
+            for name in (
+                "block_instruction.facts",
+                "instruction_read_access.facts",
+                "instruction_write_access.facts",
+            )
+        ]
+
+        if parallel:
+            pool = stack.enter_context(
+                multiprocessing.get_context("fork").Pool(jobs)
+            )
+            results = pool.imap(_decode_range, chunks)
+        else:
+            results = map(_decode_range, chunks)
+
+        # Results are yielded in chunk order, so write them as they arrive
+        for result in results:
+            for (writer, rows) in zip(writers, result):
+                writer.write_rows(rows)
+
+
+def _read_fact_rows(path: Path) -> Iterator[List[str]]:
+    """Read the rows of a facts file written from ddisasm's facts
+    :param path: Path to the facts file
+    :returns: Columns of each row
+    """
+    with open(path, newline="") as f:
+        yield from csv.reader(f, "souffle")
 
-        for block in module.code_blocks:
-            blocks.append((block.address, block.size))
 
-    with open(directory / "block.facts", "w") as f:
-        csv.writer(f, "souffle").writerows(blocks)
+# Access modes of ddisasm's register_access facts
+REGISTER_ACCESS_MODES = ("R", "W")
 
 
-def extract_edge_relations(ir: gtirb.IR, directory: Path):
-    """Write souffle facts about edges in the CFG for a GTIRB IR
-    :param ir: IR that is being loaded
+def _address_rows(path: Path) -> Iterator[Tuple[int, List[str]]]:
+    """Read the rows of a facts file of ddisasm's, keyed by the address in
+        their first column
+    :param path: Path to the facts file
+    :returns: Address and columns of each row
+    :raises ValueError: If a row has no address, or the rows are not sorted
+        by address
+    """
+    previous = -1
+
+    for row in _read_fact_rows(path):
+        if not row:
+            raise ValueError(f"Empty row in {path.name}")
+
+        ea = int(row[0], 0)
+
+        if ea < previous:
+            raise ValueError(f"{path.name} is not sorted by address")
+
+        previous = ea
+        yield (ea, row)
+
+
+def _facts_instructions(
+    module: gtirb.Module, directory: Path
+) -> Iterator[Tuple[int, int, List[str], List[str]]]:
+    """Get the instructions of the code blocks of a module from the
+        instruction and register access facts ddisasm exported, rather than by
+        decoding them again. The instructions of a block are found by
+        stepping through it by the size of each instruction from its address.
+        Both facts files are read once, alongside the blocks in address order,
+        so only the accesses of one instruction are held in memory.
+    :param module: Module that is being loaded
+    :param directory: Directory ddisasm's facts have been written to
+    :returns: Address, block address, registers read and registers written
+        of each instruction, in the order decoding writes them. Accesses to
+        registers the datalog does not track are kept, as decoding keeps
+        them, since the datalog filters them out.
+    :raises ValueError: If the facts do not cover every block, or have a
+        malformed row
+    """
+    instructions = _address_rows(directory / "instruction.facts")
+    accesses = _address_rows(directory / "register_access.facts")
+    instruction = next(instructions, None)
+    access = next(accesses, None)
+    previous_end = None
+
+    for block in sorted(module.code_blocks, key=_block_order):
+        if block.address is None:
+            raise ValueError("Code block without an address")
+
+        if (
+            block.size
+            and previous_end is not None
+            and block.address < previous_end
+        ):
+            raise ValueError(f"Code block at {block.address} overlaps")
+
+        ea = block.address
+        end = block.address + block.size
+
+        while ea < end:
+            while instruction is not None and instruction[0] < ea:
+                instruction = next(instructions, None)
+
+            if instruction is None or instruction[0] != ea:
+                raise ValueError(f"No instruction at {ea}")
+
+            size = int(instruction[1][1])
+
+            if size <= 0:
+                raise ValueError(f"Instruction at {ea} has no size")
+
+            reads: List[str] = []
+            writes: List[str] = []
+
+            while access is not None and access[0] < ea:
+                access = next(accesses, None)
+
+            # ddisasm exports the address, access mode and register of each
+            # access
+            while access is not None and access[0] == ea:
+                row = access[1]
+
+                if len(row) != 3 or row[1] not in REGISTER_ACCESS_MODES:
+                    raise ValueError(f"Malformed register access at {ea}")
+
+                (reads if row[1] == "R" else writes).append(row[2])
+                access = next(accesses, None)
+
+            yield (ea, block.address, reads, writes)
+            ea += size
+
+        if ea != end:
+            raise ValueError(f"Instructions overrun block at {block.address}")
+
+        if block.size:
+            previous_end = end
+
+
+def extract_facts_instruction_relations(
+    module: gtirb.Module, directory: Path
+) -> bool:
+    """Write souffle facts about instructions in the CFG for a GTIRB module
+        from the facts ddisasm exported, without decoding any instructions.
+        The facts are checked in a first pass, so that nothing is written if
+        they do not fit, and the rows are written as they are read in a
+        second.
+    :param module: Module that is being loaded
+    :param directory: Directory ddisasm's facts have been written to, by
+        extract_module_souffle_relations, and to output facts to
+    :returns: Whether the facts were written, which they are not if ddisasm
+        did not export register accesses, its instructions do not cover
+        every block or its facts have a malformed row
+    """
+    if not all(
+        (directory / name).exists()
+        for name in ("instruction.facts", "register_access.facts")
+    ):
+        return False
+
+    try:
+        for _ in _facts_instructions(module, directory):
+            pass
+    except (IndexError, ValueError) as e:
+        logging.debug(f"Not using ddisasm's instruction facts: {e}")
+        return False
+
+    with contextlib.ExitStack() as stack:
+        (block_instruction, read_access, write_access) = [
+            stack.enter_context(FactWriter(directory / name))
+            for name in (
+                "block_instruction.facts",
+                "instruction_read_access.facts",
+                "instruction_write_access.facts",
+            )
+        ]
+
+        for (ea, block, reads, writes) in _facts_instructions(
+            module, directory
+        ):
+            block_instruction.write((ea, block))
+            read_access.write_rows((ea, reg) for reg in reads)
+            write_access.write_rows((ea, reg) for reg in writes)
+
+    return True
+
+
+def extract_block_relations(module: gtirb.Module, directory: Path):
+    """Write souffle facts about blocks in the CFG for a GTIRB module
+    :param module: Module that is being loaded
     :param directory: Directory to output facts to
     """
-    edges = []
-    top_edges = []
-    symbol_edges = []
+    with FactWriter(directory / "block.facts") as blocks:
+        for block in module.code_blocks:
+            blocks.write((block.address, block.size))
 
-    for edge in ir.cfg:
-        if isinstance(edge.source, gtirb.CodeBlock):
+
+def extract_edge_relations(module: gtirb.Module, directory: Path):
+    """Write souffle facts about edges in the CFG from the blocks of a GTIRB
+        module
+    :param module: Module that is being loaded
+    :param directory: Directory to output facts to
+    """
+    with contextlib.ExitStack() as stack:
+        edges, top_edges, symbol_edges = (
+            stack.enter_context(FactWriter(directory / name))
+            for name in (
+                "cfg_edge.facts",
+                "cfg_edge_to_top.facts",
+                "cfg_edge_to_symbol.facts",
+            )
+        )
+
+        for edge in (
+            edge
+            for block in module.code_blocks
+            for edge in block.outgoing_edges
+        ):
             conditional = str(edge.label.conditional).lower()
             indirect = str(not edge.label.direct).lower()
             label_type = edge.label.type.name.lower()
 
             if isinstance(edge.target, gtirb.CodeBlock):
-                edges.append(
+                edges.write(
                     (
                         edge.source.address,
                         edge.target.address,
@@ -208,7 +715,7 @@ def extract_edge_relations(ir: gtirb.IR, directory: Path):
                 if any(edge.target.references):
                     symbol = next(edge.target.references)
 
-                    symbol_edges.append(
+                    symbol_edges.write(
                         (
                             edge.source.address,
                             symbol.name,
@@ -218,7 +725,7 @@ def extract_edge_relations(ir: gtirb.IR, directory: Path):
                         )
                     )
                 else:
-                    top_edges.append(
+                    top_edges.write(
                         (
                             edge.source.address,
                             conditional,
@@ -227,30 +734,29 @@ def extract_edge_relations(ir: gtirb.IR, directory: Path):
                         )
                     )
 
-    with open(directory / "cfg_edge.facts", "w") as f:
-        csv.writer(f, "souffle").writerows(edges)
-
-    with open(directory / "cfg_edge_to_top.facts", "w") as f:
-        csv.writer(f, "souffle").writerows(top_edges)
 
-    with open(directory / "cfg_edge_to_symbol.facts", "w") as f:
-        csv.writer(f, "souffle").writerows(symbol_edges)
-
-
-def extract_cfg_relations(ir: gtirb.IR, directory: Path):
-    """Write souffle facts from the CFG in the current GTIRB IR
-    :param ir: IR that is being loaded
-    :param directory: Directory to output facts to
+def extract_cfg_relations(
+    module: gtirb.Module, directory: Path, jobs: int = 1
+):
+    """Write souffle facts from the CFG of a GTIRB module. Instructions are
+        only decoded if the facts ddisasm exported to the directory do not
+        describe them.
+    :param module: Module that is being loaded
+    :param directory: Directory to output facts to, which ddisasm's facts
+        are read from if they have been extracted to it
+    :param jobs: Number of processes to decode instructions with
     """
-    extract_instruction_relations(ir, directory)
-    extract_block_relations(ir, directory)
-    extract_edge_relations(ir, directory)
+    if not extract_facts_instruction_relations(module, directory):
+        logging.info("Decoding instructions, ddisasm's facts are incomplete")
+        extract_instruction_relations(module, directory, jobs)
+    extract_block_relations(module, directory)
+    extract_edge_relations(module, directory)
 
 
-def extract_arch_relations(ir: gtirb.IR, directory: Path):
-    """Write souffle facts from the architecture in the current GTIRB IR
-    :param ir: IR that is being loaded
+def extract_arch_relations(module: gtirb.Module, directory: Path):
+    """Write souffle facts from the architecture of a GTIRB module
+    :param module: Module that is being loaded
     :param directory: Directory to output facts to
     """
-    pointer, _ = get_arch_sizes(ir.modules[0])
+    pointer, _ = get_arch_sizes(module)
     (directory / "arch.pointer_size.facts").write_text(str(pointer))
@@ -20,75 +20,582 @@
 # official endorsement should be inferred.
 
 import argparse
-from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import contextlib
 import gtirb
+import hashlib
+import json
 import logging
+import multiprocessing
+import os
+import pickle
 import tempfile
 
+from ddisasm_retypd.cache import (
+    FACT_CACHE_FORMATS,
+    load_facts,
+    load_outputs,
+    outputs_key,
+    store_facts,
+    store_outputs,
+)
 from ddisasm_retypd.ddisasm import (
     extract_arch_relations,
     extract_cfg_relations,
-    extract_souffle_relations,
+    extract_module_souffle_relations,
+    facts_key,
     get_arch_sizes,
     get_callgraph,
+    get_function_names,
+    get_stub_links,
 )
-from ddisasm_retypd.gtirb_read import RetypdGtirbReader
+from ddisasm_retypd.gtirb_read import RetypdGtirbReader, generate_lattices
 from ddisasm_retypd.gtirb_write import RetypdGtirbWriter
-from ddisasm_retypd.souffle import execute_souffle
+from ddisasm_retypd.instrument import TRACE_FORMATS, span, tracing
+from ddisasm_retypd.souffle import (
+    default_cache_dir,
+    default_jobs,
+    execute_souffle,
+    summarize_profile,
+)
+from ddisasm_retypd.version import __version__
 
 from collections import defaultdict
 from pathlib import Path
 
+import retypd
 from retypd.clattice import CLattice, CLatticeCTypes
 from retypd.c_type_generator import CTypeGenerator
 from retypd.c_types import CType, FunctionType, PointerType, StructType
 from retypd.solver import Sketches
-from retypd.parser import SchemaParser
-from retypd.schema import ConstraintSet, DerivedTypeVariable, Program
+from retypd.schema import (
+    AccessPathLabel,
+    ConstraintSet,
+    DerefLabel,
+    DerivedTypeVariable,
+    InLabel,
+    LoadLabel,
+    OutLabel,
+    Program,
+    StoreLabel,
+    SubtypeConstraint,
+)
 from retypd.solver import Solver, LogLevel
 
+# Solutions cached by a different retypd may not be valid
+RETYPD_VERSION = getattr(retypd, "__version__", "")
+
+
+def _make_label(kind: str, value: int, offset: int) -> AccessPathLabel:
+    """Build an access path label from its datalog path_label columns
+    :param kind: Kind of label
+    :param value: Index of an in label, or size of a deref label
+    :param offset: Offset of a deref label
+    :returns: Access path label
+    """
+    if kind == "in":
+        return InLabel(value)
+    elif kind == "out":
+        return OutLabel.instance()
+    elif kind == "load":
+        return LoadLabel.instance()
+    elif kind == "store":
+        return StoreLabel.instance()
+    elif kind == "deref":
+        return DerefLabel(value, offset)
+    else:
+        raise ValueError(f"Unknown label kind {kind}")
+
+
+def _build_paths(
+    type_variables: Iterable[Tuple[str, ...]],
+    labels: Iterable[Tuple[str, ...]],
+    names: Optional[Dict[str, str]] = None,
+) -> Dict[str, DerivedTypeVariable]:
+    """Build the DTVs of paths output by datalog, so that a path which occurs
+        in many constraints is only built once
+    :param type_variables: Rows of path_type_variable
+    :param labels: Rows of path_label
+    :param names: Names of functions in the IR by their names in the module
+        the rows were output for, which their type variables are renamed to
+    :returns: Mapping of path identifier to its DTV
+    """
+    label_cache: Dict[Tuple[str, ...], AccessPathLabel] = {}
+    path_labels = defaultdict(list)
+
+    for (path, index, kind, value, offset) in labels:
+        key = (kind, value, offset)
+
+        if key not in label_cache:
+            label_cache[key] = _make_label(kind, int(value), int(offset))
+
+        path_labels[path].append((int(index), label_cache[key]))
+
+    paths = {}
+
+    for (path, type_var) in type_variables:
+        if names is not None:
+            type_var = names.get(type_var, type_var)
+
+        path_label_list = sorted(path_labels.get(path, []))
+        paths[path] = DerivedTypeVariable(
+            type_var, [label for (_, label) in path_label_list]
+        )
+
+    return paths
+
+
+def callgraph_components(
+    constraint_map: Dict[str, ConstraintSet], callgraph: Dict[str, Set[str]]
+) -> List[Set[str]]:
+    """Partition functions into the weakly connected components of the
+        callgraph. Functions whose constraints refer to each other are also
+        placed in the same component, so that each component can be solved on
+        its own with the same result as solving the whole program.
+    :param constraint_map: Mapping of function to its constraint set
+    :param callgraph: Mapping of function to the functions it calls
+    :returns: Components, largest first
+    """
+    parent: Dict[str, str] = {}
+
+    def find(func: str) -> str:
+        parent.setdefault(func, func)
+        while parent[func] != func:
+            parent[func] = parent[parent[func]]
+            func = parent[func]
+        return func
+
+    def union(lhs: str, rhs: str):
+        parent[find(lhs)] = find(rhs)
+
+    for (caller, callees) in callgraph.items():
+        find(caller)
+        for callee in callees:
+            union(caller, callee)
+
+    for (func, constraint_set) in constraint_map.items():
+        find(func)
+        for constraint in constraint_set.subtype:
+            for dtv in (constraint.left, constraint.right):
+                base = str(dtv.base)
+                if base != func and base in parent:
+                    union(func, base)
+
+    components = defaultdict(set)
+    for func in parent:
+        components[find(func)].add(func)
+
+    return sorted(components.values(), key=len, reverse=True)
+
+
+Solution = Tuple[
+    Dict[DerivedTypeVariable, ConstraintSet],
+    Dict[DerivedTypeVariable, Sketches],
+]
+
+
+def component_key(
+    lattice: CLattice,
+    constraint_map: Dict[str, ConstraintSet],
+    callgraph: Dict[str, Set[str]],
+    component: Set[str],
+) -> str:
+    """Compute the cache key of a callgraph component's solution, which is a
+        hash of everything the solver reads for it: the constraints and calls
+        of its functions and the lattice types
+    :param lattice: Lattice of the program's types
+    :param constraint_map: Mapping of function to its constraint set
+    :param callgraph: Mapping of function to the functions it calls
+    :param component: Functions of the component
+    :returns: Hex digest of the component
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{__version__}\0{RETYPD_VERSION}\0".encode())
+
+    for type_ in sorted(str(type_) for type_ in lattice.internal_types):
+        digest.update(f"type\0{type_}\0".encode())
+
+    for func in sorted(component):
+        digest.update(f"func\0{func}\0".encode())
+
+        if func in constraint_map:
+            for constraint in sorted(
+                str(constraint) for constraint in constraint_map[func].subtype
+            ):
+                digest.update(f"constraint\0{constraint}\0".encode())
+
+        for callee in sorted(callgraph.get(func, ())):
+            digest.update(f"call\0{callee}\0".encode())
+
+    return digest.hexdigest()
+
+
+def _load_solution(path: Path) -> Optional[Solution]:
+    """Load a cached component solution
+    :param path: Path of the cache entry
+    :returns: The solution, or None if it is not cached or is unreadable
+    """
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, pickle.UnpicklingError) as e:
+        logging.warning(f"Ignoring unreadable cached solution {path}: {e}")
+        return None
+
+
+def _store_solution(path: Path, solution: Solution):
+    """Store a component solution in the cache, atomically so that concurrent
+        processes never observe a partial entry
+    :param path: Path of the cache entry
+    :param solution: Solution to store
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as f:
+        pickle.dump(solution, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    os.replace(f.name, path)
+
+
+# Programs shared with forked solver processes, only set while solving
+_solve_programs: List[Program] = []
+
+
+def _solve_component(args: Tuple[int, LogLevel]) -> Solution:
+    """Solve the program of one callgraph component
+    :param args: Index of the program in _solve_programs, and the log level
+    :returns: Derived constraints and sketches of the component
+    """
+    (index, loglevel) = args
+    solver = Solver(_solve_programs[index], verbose=loglevel)
+    return solver()
+
+
+def solve_program(
+    lattice: CLattice,
+    constraint_map: Dict[str, ConstraintSet],
+    callgraph: Dict[str, Set[str]],
+    loglevel: LogLevel = LogLevel.QUIET,
+    jobs: int = 1,
+    cache_dir: Optional[Path] = None,
+) -> Solution:
+    """Solve the constraints of a program, splitting it by callgraph
+        component and solving the components in parallel if there is more
+        than one job
+    :param lattice: Lattice of the program's types
+    :param constraint_map: Mapping of function to its constraint set
+    :param callgraph: Mapping of function to the functions it calls
+    :param loglevel: Log level of the solver
+    :param jobs: Number of processes to solve components with
+    :param cache_dir: Directory to cache component solutions in, so that only
+        components which changed since a previous run are solved again
+    :returns: Derived constraints and sketches of the whole program
+    """
+    components = callgraph_components(constraint_map, callgraph)
+    can_fork = "fork" in multiprocessing.get_all_start_methods()
+
+    if cache_dir is None and (
+        jobs <= 1 or len(components) <= 1 or not can_fork
+    ):
+        program = Program(lattice, {}, constraint_map, callgraph)
+        solver = Solver(program, verbose=loglevel)
+        return solver()
+
+    derived_constraints = {}
+    sketches = {}
+    pending: List[Tuple[Set[str], Optional[Path]]] = []
+
+    for component in components:
+        path = None
+
+        if cache_dir is not None:
+            key = component_key(lattice, constraint_map, callgraph, component)
+            path = cache_dir / "solutions" / f"{key}.pickle"
+            cached = _load_solution(path)
+
+            if cached is not None:
+                derived_constraints.update(cached[0])
+                sketches.update(cached[1])
+                continue
+
+        pending.append((component, path))
+
+    logging.info(
+        f"Solving {len(pending)} of {len(components)} callgraph components "
+        f"with {jobs} jobs"
+    )
+
+    _solve_programs[:] = [
+        Program(
+            lattice,
+            {},
+            {
+                func: constraint_map[func]
+                for func in component
+                if func in constraint_map
+            },
+            {
+                func: callgraph[func]
+                for func in component
+                if func in callgraph
+            },
+        )
+        for (component, _) in pending
+    ]
+
+    with contextlib.ExitStack() as stack:
+        stack.callback(_solve_programs.clear)
+        args = [(index, loglevel) for index in range(len(pending))]
+
+        if jobs > 1 and len(pending) > 1 and can_fork:
+            pool = stack.enter_context(
+                multiprocessing.get_context("fork").Pool(jobs)
+            )
+            # Components are ordered largest first, so the longest solves
+            # start before the short ones that fill in around them
+            results = pool.imap(_solve_component, args)
+        else:
+            results = map(_solve_component, args)
+
+        for ((_, path), solution) in zip(pending, results):
+            derived_constraints.update(solution[0])
+            sketches.update(solution[1])
+
+            if path is not None:
+                _store_solution(path, solution)
+
+    return derived_constraints, sketches
+
 
 class DdisasmRetypd:
     DATALOG = Path(__file__).parent / "datalog" / "retypd.dl"
     # Relations to export from datalog for subtypings
-    SUBTYPE_RELS = ["subtype_constraint", "comment"]
+    SUBTYPE_RELS = [
+        "subtype_path_constraint",
+        "path_type_variable",
+        "path_label",
+    ]
+    # Relations additionally exported when running with a debug directory
+    DEBUG_RELS = ["comment"]
+    # Names of the souffle profile log and its summary in a profile directory
+    PROFILE_LOG = "souffle_profile.json"
+    PROFILE_SUMMARY = "souffle_profile_summary.json"
 
     def __init__(self, ir: gtirb.IR, facts_dir: Optional[Path] = None):
         self.ir = ir
-        self.callgraph = get_callgraph(ir)
+        self.names = get_function_names(ir)
+        self.links = get_stub_links(ir, self.names)
+        self.callgraph = get_callgraph(ir, self.names, self.links)
         self.facts_dir = facts_dir
         self.var_set = set()
         self.lattice = CLattice()
         self.lattice_ctypes = CLatticeCTypes()
 
+    def output_names(self, index: int) -> Dict[str, str]:
+        """Get the names the functions of a module have in the analysis of the
+            whole IR, in which linked stubs have the names of their targets
+        :param index: Index of the module
+        :returns: Mapping of the names of functions in the module to their
+            names in the IR
+        """
+        return {**self.names[index], **self.links[index]}
+
+    def _module_dir(
+        self, directory: Optional[Path], index: int
+    ) -> Optional[Path]:
+        """Get the directory for a module within a directory for the IR, which
+            is a subdirectory per module if the IR has several
+        :param directory: Directory for the IR, if any
+        :param index: Index of the module
+        :returns: Directory for the module
+        """
+        if directory is None or len(self.ir.modules) == 1:
+            return directory
+
+        module_dir = directory / str(index)
+        module_dir.mkdir(parents=True, exist_ok=True)
+        return module_dir
+
     def _exec_souffle(
         self,
         facts_dir: Path,
         debug_dir: Optional[Path] = None,
         compiled: bool = False,
+        cache_dir: Optional[Path] = None,
+        jobs: Optional[int] = None,
+        in_process: bool = False,
+        profile_dir: Optional[Path] = None,
+        fact_cache: Optional[str] = None,
+        cache_outputs: bool = False,
     ):
-        """Execute souffle, and if available dump relations in the debug dir
+        """Execute souffle on the facts of each module in parallel, and if
+            available dump relations in the debug dir
+        :param facts_dir: Directory to write facts to, in a subdirectory per
+            module if the IR has several
         :param debug_dir: Optional directory to dump output information to
+        :param compiled: Whether to compile the souffle program or not
+        :param cache_dir: Directory compiled souffle programs, facts and
+            souffle outputs are cached in
+        :param jobs: Number of souffle worker threads and fact extraction
+            processes, defaults to all cores
+        :param in_process: Whether to run the souffle program in this process
+        :param profile_dir: Directory to write a souffle profile log and its
+            summary to, if profiling
+        :param fact_cache: Format to cache the extracted facts of each module
+            in, one of FACT_CACHE_FORMATS, so that they are only extracted
+            again if the module changed. Facts are not cached if not given.
+        :param cache_outputs: Whether to reuse the outputs of souffle on the
+            same facts from a previous run, in which case the facts are not
+            extracted either. Outputs are not cached with a debug directory,
+            or when profiling, since souffle must run to write the profile.
         """
-        extract_souffle_relations(self.ir, facts_dir)
-        extract_cfg_relations(self.ir, facts_dir)
-        extract_arch_relations(self.ir, facts_dir)
+        modules = self.ir.modules
+        jobs = jobs or default_jobs()
+        cache_dir = cache_dir or default_cache_dir()
+
+        output_rels = list(self.SUBTYPE_RELS)
+        if debug_dir is not None:
+            output_rels += self.DEBUG_RELS
+            cache_outputs = False
+
+        if profile_dir is not None:
+            cache_outputs = False
+
+        keys = [
+            facts_key(module) if fact_cache or cache_outputs else None
+            for module in modules
+        ]
+        output_keys = [
+            outputs_key(key, self.DATALOG, output_rels)
+            if cache_outputs
+            else None
+            for key in keys
+        ]
+        outputs = [
+            load_outputs(cache_dir, key) if key is not None else None
+            for key in output_keys
+        ]
+        pending = [
+            index for (index, output) in enumerate(outputs) if output is None
+        ]
+
+        with span("extract_facts") as counts:
+            counts.update(modules=len(modules), fact_bytes=0, cached=0)
+
+            for index in pending:
+                module = modules[index]
+                module_facts = self._module_dir(facts_dir, index)
+                key = keys[index] if fact_cache else None
+
+                if key is not None and load_facts(
+                    cache_dir, key, module_facts, fact_cache
+                ):
+                    counts["cached"] += 1
+                else:
+                    extract_module_souffle_relations(module, module_facts)
+                    extract_cfg_relations(module, module_facts, jobs)
+                    extract_arch_relations(module, module_facts)
+
+                    if key is not None:
+                        store_facts(cache_dir, key, module_facts, fact_cache)
+
+                counts["fact_bytes"] += sum(
+                    path.stat().st_size
+                    for path in module_facts.glob("*.facts")
+                )
+
+        # Modules are analyzed at once, dividing the jobs between them
+        workers = 1 if in_process else max(1, len(pending))
+
+        def exec_module(index: int) -> Dict[str, Iterable[Tuple[str, ...]]]:
+            return self._exec_module_souffle(
+                self._module_dir(facts_dir, index),
+                output_rels,
+                self._module_dir(debug_dir, index),
+                compiled=compiled,
+                cache_dir=cache_dir,
+                jobs=max(1, jobs // workers),
+                in_process=in_process,
+                profile_dir=self._module_dir(profile_dir, index),
+            )
 
         logging.info("Executing souffle")
-        self._souffle_out = execute_souffle(
+        with span("souffle") as counts:
+            counts["cached"] = len(modules) - len(pending)
+
+            with ThreadPoolExecutor(workers) as executor:
+                for (index, output) in zip(
+                    pending, executor.map(exec_module, pending)
+                ):
+                    if output_keys[index] is not None:
+                        output = store_outputs(
+                            cache_dir, output_keys[index], output
+                        )
+
+                    outputs[index] = output
+
+        self._souffle_outs = outputs
+
+    def _exec_module_souffle(
+        self,
+        facts_dir: Path,
+        output_rels: List[str],
+        debug_dir: Optional[Path] = None,
+        compiled: bool = False,
+        cache_dir: Optional[Path] = None,
+        jobs: Optional[int] = None,
+        in_process: bool = False,
+        profile_dir: Optional[Path] = None,
+    ) -> Dict[str, Iterable[Tuple[str, ...]]]:
+        """Execute souffle on the facts of a module
+        :param facts_dir: Directory of the facts of the module
+        :param output_rels: List of relations to get outputs of
+        :param debug_dir: Optional directory to dump output information to
+        :param compiled: Whether to compile the souffle program or not
+        :param cache_dir: Directory compiled souffle programs are cached in
+        :param jobs: Number of souffle worker threads
+        :param in_process: Whether to run the souffle program in this process
+        :param profile_dir: Directory to write a souffle profile log and its
+            summary to, if profiling
+        :returns: Mapping of relations to their rows
+        """
+        profile = None
+        if profile_dir is not None:
+            profile_dir.mkdir(parents=True, exist_ok=True)
+            profile = profile_dir / self.PROFILE_LOG
+
+        output = execute_souffle(
             facts_dir,
             self.DATALOG,
-            self.SUBTYPE_RELS,
+            output_rels,
             compiled=compiled,
             debug_dir=debug_dir,
+            cache_dir=cache_dir,
+            jobs=jobs,
+            debug=debug_dir is not None,
+            in_process=in_process,
+            lazy=True,
+            profile=profile,
         )
 
-    def addr_to_offset(self, loc: int) -> Optional[gtirb.Offset]:
+        if profile is not None and profile.exists():
+            (profile_dir / self.PROFILE_SUMMARY).write_text(
+                json.dumps(summarize_profile(profile), indent=2)
+            )
+
+        return output
+
+    def addr_to_offset(
+        self, loc: int, module: gtirb.Module
+    ) -> Optional[gtirb.Offset]:
         """Translate an address to an offset into a block
         :param loc: Address to convert to to a block
+        :param module: Module the address is in
         :returns: If possible, the offset, otherwise None
         """
-        module = self.ir.modules[0]
         blocks = list(module.code_blocks_on(loc))
         if len(blocks) == 1:
             block = blocks[0]
@@ -112,42 +619,56 @@ class DdisasmRetypd:
         :returns: Dictionary mapping function to their constraint sets and the
             variable set of known functions to analyze
         """
-        constraints = self._souffle_out["subtype_constraint"]
-        module = self.ir.modules[0]
+        constraint_map = defaultdict(ConstraintSet)
 
-        comments = defaultdict(set)
+        for (index, (module, output)) in enumerate(
+            zip(self.ir.modules, self._souffle_outs)
+        ):
+            links = self.links[index]
+            names = self.output_names(index)
+            paths = _build_paths(
+                output["path_type_variable"], output["path_label"], names
+            )
 
-        if "comment" in self._souffle_out and debug_categories is not None:
-            for (addr, comment, category) in self._souffle_out["comment"]:
-                if category in debug_categories and addr != "0":
-                    offset = self.addr_to_offset(int(addr))
+            comments = defaultdict(set)
 
-                    if offset:
-                        comments[offset].add(comment.replace("σ", "s"))
+            if "comment" in output and debug_categories is not None:
+                for (addr, comment, category) in output["comment"]:
+                    if category in debug_categories and addr != "0":
+                        offset = self.addr_to_offset(int(addr), module)
 
-        constraint_map = defaultdict(ConstraintSet)
+                        if offset:
+                            comments[offset].add(comment.replace("σ", "s"))
 
-        for (func, constraint, _) in constraints:
-            try:
-                constr_object = SchemaParser.parse_constraint(constraint)
-            except ValueError as e:
-                logging.error(f"Failed to parse {constraint}")
-                raise e
-
-            constraint_map[func].add(constr_object)
-
-        if add_comments:
-            # NOTE: This is a bit of a hack and isn't portable across
-            # assemblers since it assumes the comments are denoted with hashtag
-            # however for our purposes (debugging) it works.
-            gtirb_comments = {
-                loc: "\n# ".join(comment)
-                for (loc, comment) in comments.items()
-            }
-
-            module.aux_data["comments"] = gtirb.AuxData(
-                gtirb_comments, "mapping<Offset,string>"
-            )
+            for (func, lhs, rhs) in output["subtype_path_constraint"]:
+                # A linked stub only passes through to its target, whose
+                # constraints are generated by the module defining it
+                if func in links:
+                    continue
+
+                if lhs not in paths or rhs not in paths:
+                    logging.debug(
+                        f"Skipping constraint of {func} on a path without "
+                        "a type variable"
+                    )
+                    continue
+
+                constraint_map[names.get(func, func)].add(
+                    SubtypeConstraint(paths[lhs], paths[rhs])
+                )
+
+            if add_comments:
+                # NOTE: This is a bit of a hack and isn't portable across
+                # assemblers since it assumes the comments are denoted with
+                # hashtag however for our purposes (debugging) it works.
+                gtirb_comments = {
+                    loc: "\n# ".join(comment)
+                    for (loc, comment) in comments.items()
+                }
+
+                module.aux_data["comments"] = gtirb.AuxData(
+                    gtirb_comments, "mapping<Offset,string>"
+                )
 
         return constraint_map
 
@@ -156,6 +677,14 @@ class DdisasmRetypd:
         debug_dir: Optional[Path],
         compiled: bool,
         debug_categories: List[str] = None,
+        cache_dir: Optional[Path] = None,
+        jobs: Optional[int] = None,
+        in_process: bool = False,
+        parallel_solve: bool = False,
+        incremental: bool = False,
+        profile_dir: Optional[Path] = None,
+        fact_cache: Optional[str] = None,
+        cache_outputs: bool = False,
     ) -> Tuple[
         Dict[DerivedTypeVariable, ConstraintSet],
         Dict[DerivedTypeVariable, Sketches],
@@ -165,22 +694,69 @@ class DdisasmRetypd:
         :param compiled: Whether to compile the souffle program or not
         :param debug_categories: Which categories of relations to insert as
             comments for the output GTIRB
+        :param cache_dir: Directory compiled souffle programs, solutions,
+            facts and souffle outputs are cached in
+        :param jobs: Number of souffle worker threads and solver processes,
+            defaults to all cores
+        :param in_process: Whether to run the souffle program in this process
+        :param parallel_solve: Whether to solve independent callgraph
+            components in parallel, using as many processes as jobs
+        :param incremental: Whether to reuse cached solutions of callgraph
+            components that are unchanged since a previous run
+        :param profile_dir: Directory to write a souffle profile log and its
+            summary to, if profiling
+        :param fact_cache: Format to cache extracted facts in, one of
+            FACT_CACHE_FORMATS, or None to always extract them
+        :param cache_outputs: Whether to reuse the outputs of souffle on the
+            same facts from a previous run
         :returns: A tuple of the mapping of the output to its derived
             constraint set, and a a mapping of the output to its sketch
         """
         if self.facts_dir:
-            self._exec_souffle(self.facts_dir, debug_dir, compiled=compiled)
+            self._exec_souffle(
+                self.facts_dir,
+                debug_dir,
+                compiled=compiled,
+                cache_dir=cache_dir,
+                jobs=jobs,
+                in_process=in_process,
+                profile_dir=profile_dir,
+                fact_cache=fact_cache,
+                cache_outputs=cache_outputs,
+            )
         else:
             with tempfile.TemporaryDirectory() as tmpdir:
-                self._exec_souffle(Path(tmpdir), debug_dir, compiled=compiled)
+                self._exec_souffle(
+                    Path(tmpdir),
+                    debug_dir,
+                    compiled=compiled,
+                    cache_dir=cache_dir,
+                    jobs=jobs,
+                    in_process=in_process,
+                    profile_dir=profile_dir,
+                        fact_cache=fact_cache,
+                    cache_outputs=cache_outputs,
+                )
 
-        constraint_map = self._insert_subtypes(
-            debug_dir is not None, debug_categories
-        )
+        with span("insert_subtypes") as counts:
+            constraint_map = self._insert_subtypes(
+                debug_dir is not None, debug_categories
+            )
+            counts.update(
+                functions=len(constraint_map),
+                constraints=sum(
+                    len(constraint_set.subtype)
+                    for constraint_set in constraint_map.values()
+                ),
+            )
+
+        # Load gtirb-type information to constraints if possible. The readers
+        # of every module share their opaque types, so that a single lattice
+        # holds all of them.
+        opaque_types = {}
 
-        # Load gtirb-type information to constraints if possible
         for module in self.ir.modules:
-            reader = RetypdGtirbReader(module)
+            reader = RetypdGtirbReader(module, opaque_types)
             for name, constraint_set in reader.load_all().items():
                 if name in constraint_map:
                     logging.info(
@@ -189,19 +765,23 @@ class DdisasmRetypd:
                     )
                 constraint_map[name] = constraint_set
 
-            # Use new lattices with opaque types supported
-            # TODO: This currently re-generates per-module, so prior modules
-            # wont be taken into account. This doesn't really matter right now
-            # since almost all GTIRB is 1-module, but if it ever comes up this
-            # should change.
-            self.lattice, self.lattice_ctypes = reader.generate_lattices()
-
-        program = Program(self.lattice, {}, constraint_map, self.callgraph)
+        # Use new lattices with opaque types supported
+        self.lattice, self.lattice_ctypes = generate_lattices(opaque_types)
 
         logging.info("Solving constraints")
         loglevel = LogLevel.DEBUG if debug_dir else LogLevel.QUIET
-        solver = Solver(program, verbose=loglevel)
-        derived_constraints, sketches = solver()
+        with span("solve") as counts:
+            derived_constraints, sketches = solve_program(
+                self.lattice,
+                constraint_map,
+                self.callgraph,
+                loglevel,
+                (jobs or default_jobs()) if parallel_solve else 1,
+                (cache_dir or default_cache_dir()) if incremental else None,
+            )
+            counts.update(
+                functions=len(constraint_map), sketches=len(sketches)
+            )
 
         if debug_dir is not None:
             for dtv, derived_constraint in derived_constraints.items():
@@ -227,28 +807,82 @@ class DdisasmRetypd:
         debug_dir: Optional[Path] = None,
         compiled: bool = False,
         debug_categories: List[str] = None,
+        cache_dir: Optional[Path] = None,
+        jobs: Optional[int] = None,
+        in_process: bool = False,
+        parallel_solve: bool = False,
+        incremental: bool = False,
+        profile_dir: Optional[Path] = None,
+        fact_cache: Optional[str] = None,
+        cache_outputs: bool = False,
     ) -> Dict[DerivedTypeVariable, CType]:
         """Execute the retypd algorithm
         :param debug_dir: Directory to write debug output if desired
         :param compiled: Whether or not to compile the souffle program
         :param debug_categories: Which categories of relations to insert as
             comments for the output GTIRB
+        :param cache_dir: Directory compiled souffle programs, solutions,
+            facts and souffle outputs are cached in
+        :param jobs: Number of souffle worker threads and solver processes,
+            defaults to all cores
+        :param in_process: Whether to run the souffle program in this process
+        :param parallel_solve: Whether to solve independent callgraph
+            components in parallel, using as many processes as jobs
+        :param incremental: Whether to reuse cached solutions of callgraph
+            components that are unchanged since a previous run
+        :param profile_dir: Directory to write a souffle profile log and its
+            summary to, if profiling
+        :param fact_cache: Format to cache extracted facts in, one of
+            FACT_CACHE_FORMATS, or None to always extract them
+        :param cache_outputs: Whether to reuse the outputs of souffle on the
+            same facts from a previous run
         :returns: Dictionary of DTV to generated C-type
+        :raises ValueError: If the IR has no modules, or its modules have
+            different address or register sizes
         """
-        addr_size, reg_size = get_arch_sizes(self.ir.modules[0])
+        if not self.ir.modules:
+            raise ValueError("The IR has no modules to type")
+
+        sizes = [
+            (module.name, get_arch_sizes(module)) for module in self.ir.modules
+        ]
+        if len({module_sizes for (_, module_sizes) in sizes}) > 1:
+            raise ValueError(
+                "Modules have different address and register sizes: "
+                + ", ".join(
+                    f"{name} ({addr}, {reg})"
+                    for (name, (addr, reg)) in sizes
+                )
+            )
+
+        addr_size, reg_size = sizes[0][1]
         _, sketches = self._solve_constraints(
-            debug_dir, compiled, debug_categories
+            debug_dir,
+            compiled,
+            debug_categories,
+            cache_dir,
+            jobs,
+            in_process,
+            parallel_solve,
+            incremental,
+            profile_dir,
+            fact_cache,
+            cache_outputs,
         )
 
-        gen = CTypeGenerator(
-            sketches,
-            self.lattice,
-            self.lattice_ctypes,
-            reg_size,
-            addr_size,
-            verbose=LogLevel.DEBUG if debug_dir else LogLevel.QUIET,
-        )
-        return gen()
+        with span("ctype_generation") as counts:
+            gen = CTypeGenerator(
+                sketches,
+                self.lattice,
+                self.lattice_ctypes,
+                reg_size,
+                addr_size,
+                verbose=LogLevel.DEBUG if debug_dir else LogLevel.QUIET,
+            )
+            types = gen()
+            counts["types"] = len(types)
+
+        return types
 
 
 def print_user_types(types: Dict[DerivedTypeVariable, CType]):
@@ -290,6 +924,46 @@ def print_user_types(types: Dict[DerivedTypeVariable, CType]):
             print(type_.pretty_print(""))
 
 
+def retype_file(
+    gtirb_path: Path,
+    dest: Path,
+    debug_dir: Optional[Path] = None,
+    **kwargs,
+) -> Dict[DerivedTypeVariable, CType]:
+    """Run retypd on a GTIRB file, and write a copy annotated with the types
+    :param gtirb_path: ddisasm generated GTIRB to operate on
+    :param dest: Path to write the annotated GTIRB to
+    :param debug_dir: Directory to write debug output if desired
+    :param kwargs: Other arguments of DdisasmRetypd.__call__
+    :returns: Dictionary of DTV to generated C-type
+    """
+    with span("load_gtirb"):
+        ir = gtirb.IR.load_protobuf(str(gtirb_path))
+
+    dr = DdisasmRetypd(ir, debug_dir)
+    type_outs = dr(debug_dir, **kwargs)
+
+    with span("write_types") as counts:
+        module_names = [
+            set(dr.output_names(index).values())
+            for index in range(len(ir.modules))
+        ]
+
+        for (index, module) in enumerate(ir.modules):
+            other_names = set().union(
+                *module_names[:index], *module_names[index + 1 :]
+            )
+            writer = RetypdGtirbWriter(module)
+            writer.add_types(type_outs, dr.output_names(index), other_names)
+
+        counts["modules"] = len(ir.modules)
+
+    with span("save_gtirb"):
+        ir.save_protobuf(str(dest))
+
+    return type_outs
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Run retypd on ddisasm-generated GTIRB files"
@@ -306,26 +980,97 @@ def main():
         action="append",
         help="Categories of relations to include as comments",
     )
+    parser.add_argument(
+        "-c",
+        "--compiled",
+        action="store_true",
+        help="Run a compiled build of the souffle program",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        help="Directory to cache compiled programs, solutions, facts and "
+        "souffle outputs in",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Number of souffle worker threads and solver processes "
+        "(default: all cores)",
+    )
+    parser.add_argument(
+        "--in-process",
+        action="store_true",
+        help="Run a compiled souffle program in-process through SWIG",
+    )
+    parser.add_argument(
+        "--parallel-solve",
+        action="store_true",
+        help="Solve independent callgraph components in parallel",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Reuse cached solutions of unchanged callgraph components",
+    )
+    parser.add_argument(
+        "--fact-cache",
+        choices=FACT_CACHE_FORMATS,
+        help="Cache the extracted facts of each module in the cache "
+        "directory, as a directory or a compressed archive",
+    )
+    parser.add_argument(
+        "--cache-outputs",
+        action="store_true",
+        help="Reuse souffle outputs of a previous run on the same facts",
+    )
+    parser.add_argument(
+        "--trace",
+        type=Path,
+        help="Path to write the time and memory of each stage to",
+    )
+    parser.add_argument(
+        "--trace-format",
+        choices=TRACE_FORMATS,
+        default="json",
+        help="Format of the trace, JSON spans or a Chrome trace",
+    )
+    parser.add_argument(
+        "--profile",
+        type=Path,
+        help="Directory to write a souffle profile and its summary to",
+    )
     args = parser.parse_args()
     logging.getLogger().setLevel(
         logging.DEBUG if args.debug_dir is not None else logging.INFO
     )
 
-    ir = gtirb.IR.load_protobuf(str(args.gtirb))
-
     logging.debug(f"Outputting relations to {args.debug_dir}")
-    dr = DdisasmRetypd(ir, args.debug_dir)
-    type_outs = dr(args.debug_dir, debug_categories=args.debug_category)
+    with tracing() as tracer:
+        with span("retype"):
+            type_outs = retype_file(
+                args.gtirb,
+                args.dest,
+                args.debug_dir,
+                compiled=args.compiled,
+                debug_categories=args.debug_category,
+                cache_dir=args.cache_dir,
+                jobs=args.jobs,
+                in_process=args.in_process,
+                parallel_solve=args.parallel_solve,
+                incremental=args.incremental,
+                profile_dir=args.profile,
+                fact_cache=args.fact_cache,
+                cache_outputs=args.cache_outputs,
+            )
+
+    if args.trace is not None:
+        tracer.write(args.trace, args.trace_format)
 
     if args.debug_dir is not None:
         print_user_types(type_outs)
 
-    for module in ir.modules:
-        writer = RetypdGtirbWriter(module)
-        writer.add_types(type_outs)
-
-    ir.save_protobuf(str(args.dest))
-
 
 if __name__ == "__main__":
     main()
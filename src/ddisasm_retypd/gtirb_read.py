@@ -52,7 +52,7 @@ from retypd.schema import (
     StoreLabel,
     SubtypeConstraint,
 )
-from typing import Dict, FrozenSet, List, Set, Tuple, Type, TypeVar
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple, Type, TypeVar
 import gtirb
 import logging
 import uuid
@@ -77,6 +77,65 @@ class OpaqueType(c_types.CType):
         return f"OPAQUE<{self.type_id}>"
 
 
+class GTIRBLattice(CLattice):
+    """CLattice which supports opaque types. This is defined at module level,
+    rather than per reader, so that lattices can be pickled.
+    """
+
+    def __init__(self, opaque: FrozenSet[DerivedTypeVariable]) -> None:
+        self._opaque = opaque
+        super().__init__()
+        # Add edges into lattice and re-compute reverse
+        for dtv in self._opaque:
+            self.graph.add_edge(dtv, self._top)
+            self.graph.add_edge(self._bottom, dtv)
+
+        # Recompute _internal after CLattice constructor since graph wont
+        # have opaque nodes and cyclic check will fail
+        self._internal = self._internal | self._opaque
+        self.revgraph = self.graph.reverse()
+
+    @property
+    def atomic_types(self) -> FrozenSet[DerivedTypeVariable]:
+        return self._internal | self._endcaps
+
+    @property
+    def internal_types(self) -> FrozenSet[DerivedTypeVariable]:
+        return self._internal
+
+
+class GTIRBLatticeCTypes(CLatticeCTypes):
+    """CTypes Lattice which supports opaque types"""
+
+    def __init__(
+        self, opaque_types: Dict[uuid.UUID, DerivedTypeVariable]
+    ) -> None:
+        super().__init__()
+        self.lookup = {v: k for k, v in opaque_types.items()}
+
+    def atom_to_ctype(self, lower_bound, upper_bound, byte_size):
+        """Override DTV -> CType to support opaque types"""
+        if lower_bound in self.lookup or upper_bound in self.lookup:
+            element = self.lookup.get(lower_bound) or self.lookup[upper_bound]
+
+            return c_types.PointerType(OpaqueType(element), byte_size)
+
+        return super().atom_to_ctype(lower_bound, upper_bound, byte_size)
+
+
+def generate_lattices(
+    opaque_types: Dict[uuid.UUID, DerivedTypeVariable]
+) -> Tuple[Lattice, LatticeCTypes]:
+    """Generate Retypd lattices for a set of opaque types
+    :param opaque_types: Opaque types, which may be shared by the readers of
+        many modules
+    :returns: Lattice for retypd and lattice for CTypes
+    """
+    gtirb_lattice = GTIRBLattice(frozenset(opaque_types.values()))
+    gtirb_lattice_ctypes = GTIRBLatticeCTypes(opaque_types)
+    return (gtirb_lattice, gtirb_lattice_ctypes)
+
+
 class RetypdGtirbReader:
     """Generate retypd constraints from a GTIRB Module"""
 
@@ -111,7 +170,16 @@ class RetypdGtirbReader:
             else:
                 return deref.add_suffix(StoreLabel.instance())
 
-    def __init__(self, module: gtirb.Module):
+    def __init__(
+        self,
+        module: gtirb.Module,
+        opaque_types: Optional[Dict[uuid.UUID, DerivedTypeVariable]] = None,
+    ):
+        """
+        :param module: Module to generate constraints from
+        :param opaque_types: Opaque types to add to, which can be shared by
+            the readers of several modules to generate a single lattice
+        """
         self.module = module
         self.types = GtirbTypes.build_types(module)
         self.functions = {
@@ -123,7 +191,9 @@ class RetypdGtirbReader:
         else:
             self.prototypes = {}
 
-        self.opaque_types: Dict[uuid.UUID, DerivedTypeVariable] = {}
+        self.opaque_types: Dict[uuid.UUID, DerivedTypeVariable] = (
+            {} if opaque_types is None else opaque_types
+        )
 
     @classmethod
     def from_path(cls: Type[_T], ir_path: Path) -> List[_T]:
@@ -313,51 +383,4 @@ class RetypdGtirbReader:
         """Generate Retypd lattices for the currently discovered opaque types
         :returns: Lattice for retypd and lattice for CTypes
         """
-        # Add all opaque type DTVs to the C-Lattice which is normally used
-        class GTIRBLattice(CLattice):
-            """CLattice which supports opaque types"""
-
-            _opaque = frozenset(self.opaque_types.values())
-
-            def __init__(self) -> None:
-                super().__init__()
-                # Add edges into lattice and re-compute reverse
-                for dtv in self._opaque:
-                    self.graph.add_edge(dtv, self._top)
-                    self.graph.add_edge(self._bottom, dtv)
-
-                # Recompute _internal after CLattice constructor since graph
-                # wont have opaque nodes and cyclic check will fail
-                self._internal = self._internal | self._opaque
-                self.revgraph = self.graph.reverse()
-
-            @property
-            def atomic_types(self) -> FrozenSet[DerivedTypeVariable]:
-                return self._internal | self._endcaps
-
-            @property
-            def internal_types(self) -> FrozenSet[DerivedTypeVariable]:
-                return self._internal
-
-        class GTIRBLatticeCTypes(CLatticeCTypes):
-            """CTypes Lattice which supports opaque types"""
-
-            lookup = {v: k for k, v in self.opaque_types.items()}
-
-            def atom_to_ctype(self, lower_bound, upper_bound, byte_size):
-                """Override DTV -> CType to support opaque types"""
-                if lower_bound in self.lookup or upper_bound in self.lookup:
-                    element = (
-                        self.lookup.get(lower_bound)
-                        or self.lookup[upper_bound]
-                    )
-
-                    return c_types.PointerType(OpaqueType(element), byte_size)
-
-                return super().atom_to_ctype(
-                    lower_bound, upper_bound, byte_size
-                )
-
-        gtirb_lattice = GTIRBLattice()
-        gtirb_lattice_ctypes = GTIRBLatticeCTypes()
-        return (gtirb_lattice, gtirb_lattice_ctypes)
+        return generate_lattices(self.opaque_types)
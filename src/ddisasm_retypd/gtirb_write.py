@@ -20,7 +20,8 @@
 # official endorsement should be inferred.
 
 import logging
-from typing import Dict
+from typing import Dict, Optional, Set
+from ddisasm_retypd.ddisasm import filter_name
 from ddisasm_retypd.gtirb_read import OpaqueType
 from gtirb_functions import Function
 from gtirb_types import (
@@ -143,19 +144,40 @@ class RetypdGtirbWriter:
             raise NotImplementedError()
 
     def add_types(
-        self, derived_types: Dict[DerivedTypeVariable, c_types.CType]
+        self,
+        derived_types: Dict[DerivedTypeVariable, c_types.CType],
+        names: Optional[Dict[str, str]] = None,
+        other_names: Optional[Set[str]] = None,
     ):
         """Add all types from the output to a GTIRB module
         :param derived_types: Output CType map from retypd
+        :param names: Names of the functions in the output by their names in
+            the module, if the output is for several modules
+        :param other_names: Names in the output of the functions of the other
+            modules, whose types are skipped
         """
         functions = Function.build_functions(self.module)
-        name2func = {function.names[0]: function for function in functions}
+
+        if names is None:
+            name2func = {function.names[0]: function for function in functions}
+        else:
+            name2func = {
+                names[name]: function
+                for function in functions
+                for name in (*function.names, filter_name(function))
+                if name in names
+            }
+
         prototypeTable = {}
 
         for dtv, type_obj in derived_types.items():
-            type_id = self._translate_ctype(type_obj)
             func = name2func.get(str(dtv), None)
 
+            if func is None and other_names and str(dtv) in other_names:
+                continue
+
+            type_id = self._translate_ctype(type_obj)
+
             if func is not None:
                 prototypeTable[func.uuid] = type_id
             else:
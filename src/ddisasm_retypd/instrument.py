@@ -0,0 +1,223 @@
+# Copyright (C) 2022 GrammaTech, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# This project is sponsored by the Office of Naval Research, One
+# Liberty Center, 875 N. Randolph Street, Arlington, VA 22203 under
+# contract #N68335-17-C-0700.  The content of the information does not
+# necessarily reflect the position or policy of the Government and no
+# official endorsement should be inferred.
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import contextlib
+import json
+import os
+import threading
+import time
+
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+TRACE_FORMATS = ("json", "chrome")
+
+
+def _peak_rss_kb() -> Tuple[Optional[int], Optional[int]]:
+    """Peak resident set size of this process and its waited-for children
+        over their lifetimes
+    :returns: Peak RSS in KiB of this process and its children, which are
+        None if the platform does not report them
+    """
+    if resource is None:
+        return (None, None)
+
+    return (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+
+
+def _rss_kb() -> Optional[int]:
+    """Current resident set size of this process
+    :returns: RSS in KiB, or None if the platform does not report it
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+
+    return pages * os.sysconf("SC_PAGE_SIZE") // 1024
+
+
+def _growth(before: Optional[int], after: Optional[int]) -> Optional[int]:
+    """Growth of a high-water mark across a span
+    :param before: Mark at the start of the span
+    :param after: Mark at the end of the span
+    :returns: Growth, or None if the mark is not reported
+    """
+    if before is None or after is None:
+        return None
+
+    return max(0, after - before)
+
+
+def _children_cpu() -> float:
+    """CPU time of waited-for children of this process, such as souffle
+    :returns: CPU time in seconds
+    """
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+class Tracer:
+    """Record nested spans of the pipeline, each with its wall time, CPU time,
+    memory and counts of the items it processed. The memory of a span is the
+    RSS of the process at its end, and how much it raised the peak RSS of the
+    process and of its children.
+    """
+
+    def __init__(self):
+        self.spans: List[Dict[str, Any]] = []
+        self._origin = time.perf_counter()
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def span(self, name: str) -> Iterator[Dict[str, int]]:
+        """Record a span around a block of code
+        :param name: Name of the span
+        :returns: Dictionary which the block can add counts to
+        """
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+
+        stack = self._local.stack
+        counts: Dict[str, int] = {}
+        record = {
+            "name": name,
+            "parent": stack[-1]["name"] if stack else None,
+            "depth": len(stack),
+            "thread": threading.get_ident(),
+        }
+        stack.append(record)
+
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        children_cpu_start = _children_cpu()
+        (peak_start, children_peak_start) = _peak_rss_kb()
+
+        try:
+            yield counts
+        finally:
+            stack.pop()
+            (peak, children_peak) = _peak_rss_kb()
+            record.update(
+                start=start - self._origin,
+                wall=time.perf_counter() - start,
+                cpu=time.process_time() - cpu_start,
+                children_cpu=_children_cpu() - children_cpu_start,
+                rss_kb=_rss_kb(),
+                peak_rss_growth_kb=_growth(peak_start, peak),
+                children_peak_rss_growth_kb=_growth(
+                    children_peak_start, children_peak
+                ),
+                counts=counts,
+            )
+            self.spans.append(record)
+
+    def to_json(self) -> Dict[str, Any]:
+        """Get the spans, in the order they started
+        :returns: JSON-serializable report of the spans
+        """
+        return {"spans": sorted(self.spans, key=lambda span: span["start"])}
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """Get the spans as complete events of the Chrome trace event format,
+            which can be loaded in chrome://tracing or Perfetto
+        :returns: JSON-serializable trace
+        """
+        pid = os.getpid()
+        events = [
+            {
+                "name": span["name"],
+                "ph": "X",
+                "ts": span["start"] * 1e6,
+                "dur": span["wall"] * 1e6,
+                "pid": pid,
+                "tid": span["thread"],
+                "args": {
+                    "cpu": span["cpu"],
+                    "children_cpu": span["children_cpu"],
+                    "rss_kb": span["rss_kb"],
+                    "peak_rss_growth_kb": span["peak_rss_growth_kb"],
+                    "children_peak_rss_growth_kb": span[
+                        "children_peak_rss_growth_kb"
+                    ],
+                    **span["counts"],
+                },
+            }
+            for span in self.spans
+        ]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, path: Path, trace_format: str = "json"):
+        """Write the spans to a file
+        :param path: Path to write to
+        :param trace_format: Either json or chrome
+        """
+        if trace_format == "chrome":
+            data = self.to_chrome_trace()
+        elif trace_format == "json":
+            data = self.to_json()
+        else:
+            raise ValueError(f"Unknown trace format {trace_format}")
+
+        path.write_text(json.dumps(data, indent=2))
+
+
+# Tracer spans are recorded to, if any
+_tracer: Optional[Tracer] = None
+
+
+@contextlib.contextmanager
+def tracing(tracer: Optional[Tracer] = None) -> Iterator[Tracer]:
+    """Record the spans of the pipeline while in this context
+    :param tracer: Tracer to record to, by default a new one
+    :returns: The tracer spans are recorded to
+    """
+    global _tracer
+    previous = _tracer
+    _tracer = tracer or Tracer()
+
+    try:
+        yield _tracer
+    finally:
+        _tracer = previous
+
+
+@contextlib.contextmanager
+def span(name: str) -> Iterator[Dict[str, int]]:
+    """Record a span to the current tracer, if tracing
+    :param name: Name of the span
+    :returns: Dictionary which the block can add counts to
+    """
+    if _tracer is None:
+        yield {}
+    else:
+        with _tracer.span(name) as counts:
+            yield counts
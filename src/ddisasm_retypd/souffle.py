@@ -19,12 +19,46 @@
 # necessarily reflect the position or policy of the Government and no
 # official endorsement should be inferred.
 
+import functools
+import hashlib
+import importlib
+import json
 import logging
+import os
 import shutil
 import subprocess
+import sys
 import tempfile
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from types import ModuleType
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+# Macros to pass to the souffle pre-processor for debug builds
+DEBUG_MACROS = {"DEBUG": "1"}
+
+# SWIG modules of souffle programs loaded into this process, by build key
+_SWIG_MODULES: Dict[str, ModuleType] = {}
+
+
+class RelationReader:
+    """Iterable over the rows of a souffle output relation, which are read and
+    parsed as they are iterated over rather than all at once
+    """
+
+    def __init__(self, path: Path, owner: Optional[Any] = None):
+        """
+        :param path: Path to the relation's output file
+        :param owner: Object owning the output directory, which is kept alive
+            for as long as this reader is
+        """
+        self.path = path
+        self.owner = owner
+
+    def __iter__(self) -> Iterator[Tuple[str, ...]]:
+        with open(self.path) as f:
+            for line in f:
+                yield tuple(line.rstrip("\n").split("\t"))
 
 
 def _find_souffle() -> Path:
@@ -39,41 +73,368 @@ def _find_souffle() -> Path:
     raise FileNotFoundError("Failed to find souffle")
 
 
+def default_jobs() -> int:
+    """Get the default number of souffle worker threads, which is the number
+        of cores available to this process
+    :returns: Number of worker threads
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+
+    return os.cpu_count() or 1
+
+
+def default_cache_dir() -> Path:
+    """Get the directory compiled souffle programs are cached in, which is
+        $DDISASM_RETYPD_CACHE if set, otherwise a directory in the user cache
+    :returns: Path to the cache directory
+    """
+    if "DDISASM_RETYPD_CACHE" in os.environ:
+        return Path(os.environ["DDISASM_RETYPD_CACHE"])
+
+    xdg_cache = os.environ.get("XDG_CACHE_HOME")
+    cache_home = Path(xdg_cache) if xdg_cache else Path.home() / ".cache"
+    return cache_home / "ddisasm-retypd"
+
+
+def _macro_flags(macros: Dict[str, str]) -> List[str]:
+    """Format pre-processor macros as souffle command line flags
+    :param macros: Mapping of macro name to value
+    :returns: List of flags to pass to souffle
+    """
+    if not macros:
+        return []
+
+    defines = " ".join(f"{name}={value}" for name, value in macros.items())
+    return [f"--macro='{defines}'"]
+
+
+@functools.lru_cache(maxsize=None)
+def _souffle_version(souffle: Path) -> str:
+    """Get the version reported by a souffle binary
+    :param souffle: Path to the souffle binary
+    :returns: Version string output by souffle
+    """
+    res = subprocess.run(
+        [str(souffle.resolve()), "--version"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+    )
+    return res.stdout.decode("utf-8", errors="replace").strip()
+
+
+def _write_program(
+    datalog: Path, outputs: Optional[List[str]], directory: Path
+) -> Path:
+    """Get the datalog program to run, which if outputs are given is a program
+        including the datalog file that outputs exactly those relations
+    :param datalog: Path to the datalog file
+    :param outputs: Relations to output, or None to run the file as is
+    :param directory: Directory to write the generated program to
+    :returns: Path to the datalog program
+    """
+    if outputs is None:
+        return datalog.resolve()
+
+    program = directory / datalog.name
+    lines = [f'#include "{datalog.resolve()}"']
+    lines += [f".output {output}" for output in outputs]
+    program.write_text("\n".join(lines) + "\n")
+    return program
+
+
+def datalog_hash(
+    datalog: Path,
+    macros: Dict[str, str],
+    souffle_version: str,
+    outputs: Optional[List[str]] = None,
+    profile: bool = False,
+) -> str:
+    """Content hash of a datalog program, identifying a compiled build of it
+    :param datalog: Path to the datalog file, all datalog files in the same
+        directory are hashed as they may be included
+    :param macros: Pre-processor macros the program is built with
+    :param souffle_version: Version of souffle the program is built with
+    :param outputs: Relations the program is built to output, if not the
+        ones the datalog file declares
+    :param profile: Whether the program is built with profiling
+    :returns: Hex digest of the program
+    """
+    digest = hashlib.sha256()
+    digest.update(datalog.name.encode())
+
+    for path in sorted(datalog.resolve().parent.glob("*.dl")):
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+
+    for name, value in sorted(macros.items()):
+        digest.update(f"{name}={value}".encode())
+
+    digest.update(souffle_version.encode())
+
+    if outputs is not None:
+        for output in sorted(outputs):
+            digest.update(f".output {output}".encode())
+
+    if profile:
+        digest.update(b"--profile")
+
+    return digest.hexdigest()
+
+
+def compile_souffle(
+    datalog: Path,
+    macros: Dict[str, str],
+    cache_dir: Optional[Path] = None,
+    outputs: Optional[List[str]] = None,
+    profile: bool = False,
+) -> Path:
+    """Get a compiled executable of a datalog program, compiling it only if
+        no build of the same program is in the cache
+    :param datalog: Path to datalog file to compile
+    :param macros: Pre-processor macros to build the program with
+    :param cache_dir: Cache directory, if not given the default is used
+    :param outputs: Relations to output, or None for the ones the datalog
+        file declares
+    :param profile: Whether to build the program with profiling, so that it
+        accepts a --profile option
+    :returns: Path to the compiled executable
+    """
+    souffle = _find_souffle()
+    key = datalog_hash(
+        datalog, macros, _souffle_version(souffle), outputs, profile
+    )
+    entry_dir = (cache_dir or default_cache_dir()) / key
+    executable = entry_dir / datalog.stem
+
+    if executable.exists():
+        logging.debug(f"Using cached souffle program {executable}")
+        return executable
+
+    logging.info(f"Compiling {datalog.name} to {executable}")
+    entry_dir.mkdir(parents=True, exist_ok=True)
+
+    # Build in a scratch directory and atomically move the executable into
+    # place, so concurrent processes never observe a partial build
+    with tempfile.TemporaryDirectory(dir=entry_dir) as tmpdir:
+        build_path = Path(tmpdir) / datalog.stem
+        program = _write_program(datalog, outputs, Path(tmpdir))
+        # The log path given at build time is only a default, runs of the
+        # executable pass their own
+        profile_flags = (
+            [f"--profile={Path(tmpdir) / 'profile.log'}"] if profile else []
+        )
+
+        res = subprocess.run(
+            [
+                f"{souffle.resolve()}",
+                f"--include-dir={datalog.resolve().parent}",
+                *_macro_flags(macros),
+                *profile_flags,
+                f"--dl-program={build_path}",
+                f"{program}",
+            ]
+        )
+
+        if res.returncode != 0 or not build_path.exists():
+            raise RuntimeError(f"Failed to compile {datalog}")
+
+        os.replace(build_path, executable)
+
+    return executable
+
+
+def load_souffle_module(
+    datalog: Path,
+    macros: Dict[str, str],
+    cache_dir: Optional[Path] = None,
+    outputs: Optional[List[str]] = None,
+) -> ModuleType:
+    """Get the SWIG Python module of a compiled datalog program, building it
+        only if no build of the same program is in the cache, and importing it
+        only once per process
+    :param datalog: Path to datalog file to compile
+    :param macros: Pre-processor macros to build the program with
+    :param cache_dir: Cache directory, if not given the default is used
+    :param outputs: Relations to output, or None for the ones the datalog
+        file declares
+    :returns: Imported SWIG module
+    """
+    souffle = _find_souffle()
+    key = datalog_hash(datalog, macros, _souffle_version(souffle), outputs)
+
+    if key in _SWIG_MODULES:
+        return _SWIG_MODULES[key]
+
+    entry_dir = (cache_dir or default_cache_dir()) / f"{key}-python"
+    wrapper = entry_dir / "SwigInterface.py"
+    library = entry_dir / "_SwigInterface.so"
+
+    if not wrapper.exists():
+        logging.info(f"Compiling {datalog.name} to {entry_dir}")
+        entry_dir.mkdir(parents=True, exist_ok=True)
+
+        with tempfile.TemporaryDirectory(dir=entry_dir) as tmpdir:
+            build_dir = Path(tmpdir)
+            program = _write_program(datalog, outputs, build_dir)
+
+            res = subprocess.run(
+                [
+                    f"{souffle.resolve()}",
+                    f"--include-dir={datalog.resolve().parent}",
+                    *_macro_flags(macros),
+                    "--swig=python",
+                    f"--generate={build_dir / datalog.stem}.cpp",
+                    f"{program}",
+                ],
+                cwd=build_dir,
+            )
+
+            if res.returncode != 0 or not (build_dir / wrapper.name).exists():
+                raise RuntimeError(f"Failed to compile {datalog}")
+
+            # The wrapper is moved last, as its presence marks a full build
+            os.replace(build_dir / library.name, library)
+            os.replace(build_dir / wrapper.name, wrapper)
+
+    # Every build has the same module names, so import each build as a
+    # package of its own. The wrapper imports the native library relative to
+    # its package, so each wrapper gets the library of its own build.
+    package = ModuleType(f"_souffle_{key}")
+    package.__path__ = [str(entry_dir)]
+    sys.modules[package.__name__] = package
+
+    wrapper_module = importlib.import_module(
+        f"{package.__name__}.{wrapper.stem}"
+    )
+
+    _SWIG_MODULES[key] = wrapper_module
+    return wrapper_module
+
+
+def _run_souffle(
+    facts: Path,
+    datalog: Path,
+    output_dir: Path,
+    scratch_dir: Path,
+    outputs: Optional[List[str]],
+    macros: Dict[str, str],
+    compiled: bool,
+    cache_dir: Optional[Path],
+    jobs: int,
+    in_process: bool,
+    profile: Optional[Path] = None,
+):
+    """Run a souffle program over a facts directory
+    :param facts: Path to pre-existing facts
+    :param datalog: Path to datalog file to execute
+    :param output_dir: Directory to write output relations to
+    :param scratch_dir: Directory for temporary files
+    :param outputs: Relations to output, or None for the ones the datalog
+        file declares
+    :param macros: Pre-processor macros to run the program with
+    :param compiled: Whether or not to run a compiled executable
+    :param cache_dir: Directory to cache compiled programs in
+    :param jobs: Number of souffle worker threads
+    :param in_process: Whether or not to run the program in this process
+    :param profile: Path to write a souffle profile log to, if any
+    """
+    profile_flags = [f"--profile={profile}"] if profile else []
+
+    if in_process:
+        if profile is not None:
+            logging.warning("Souffle cannot be profiled when run in-process")
+
+        module = load_souffle_module(datalog, macros, cache_dir, outputs)
+        program = module.newInstance(datalog.stem)
+        program.runAll(str(facts.resolve()), str(output_dir))
+        return
+
+    if compiled:
+        executable = compile_souffle(
+            datalog, macros, cache_dir, outputs, profile is not None
+        )
+        command = [
+            f"{executable.resolve()}",
+            f"--facts={facts.resolve()}",
+            f"--output={output_dir}",
+            f"--jobs={jobs}",
+            *profile_flags,
+        ]
+    else:
+        program = _write_program(datalog, outputs, scratch_dir)
+        command = [
+            f"{_find_souffle().resolve()}",
+            f"--fact-dir={facts.resolve()}",
+            f"--output-dir={output_dir}",
+            f"--include-dir={datalog.resolve().parent}",
+            f"--jobs={jobs}",
+            *_macro_flags(macros),
+            *profile_flags,
+            f"{program}",
+        ]
+
+    subprocess.call(command)
+
+
 def execute_souffle(
     facts: Path,
     datalog: Path,
     output_rels: List[str],
     compiled: bool = False,
     debug_dir: Optional[Path] = None,
-) -> Dict[str, List[Tuple[str, ...]]]:
+    cache_dir: Optional[Path] = None,
+    jobs: Optional[int] = None,
+    debug: bool = False,
+    in_process: bool = False,
+    lazy: bool = False,
+    profile: Optional[Path] = None,
+) -> Dict[str, Iterable[Tuple[str, ...]]]:
     """Execute souffle and get some outputs from it
     :param facts: Path to pre-existing facts
     :param datalog: Path to datalog file to execute
     :param output_rels: List of relations to get outputs of
     :param compiled: Whether or not to generate an executable for this
     :param debug_dir: Debug output directory
-    :returns: Mapping of relations to list of rows
+    :param cache_dir: Directory to cache compiled executables in
+    :param jobs: Number of souffle worker threads, if not given all available
+        cores are used
+    :param debug: If True, run a DEBUG build which computes and outputs every
+        relation declared as an output in the datalog. Otherwise only the
+        relations in output_rels are output, and only relations they depend
+        on are computed.
+    :param in_process: If True, run a compiled build of the program loaded
+        into this process through its SWIG interface rather than spawning a
+        souffle process. The SWIG interface does not expose the number of
+        worker threads, so jobs is ignored.
+    :param lazy: If True, return a RelationReader per relation which parses
+        rows as they are iterated over, and the outputs are kept on disk until
+        all readers are discarded. Otherwise all rows are read into lists.
+    :param profile: Path to write a souffle profile log to, which can be
+        summarized with summarize_profile. Compiled builds are then built
+        with profiling.
+    :returns: Mapping of relations to their rows
     """
-    souffle = _find_souffle()
     output = {}
+    tmpdir = tempfile.TemporaryDirectory()
 
-    with tempfile.TemporaryDirectory() as tmpdir:
-        tmpdir_path = debug_dir or Path(tmpdir)
-        program_path = tmpdir_path / "prog.cpp"
+    try:
+        tmpdir_path = debug_dir or Path(tmpdir.name)
+        scratch_dir = Path(tmpdir.name) / "scratch"
+        scratch_dir.mkdir()
 
-        compile_flags = []
-        if compiled:
-            compile_flags = ["--compile", f"--generate={program_path}"]
-
-        subprocess.call(
-            [
-                f"{souffle.resolve()}",
-                f"--fact-dir={facts.resolve()}",
-                f"--output-dir={tmpdir_path}",
-                "--macro='DEBUG=1'",
-                *compile_flags,
-                f"{datalog.resolve()}",
-            ]
+        _run_souffle(
+            facts,
+            datalog,
+            tmpdir_path,
+            scratch_dir,
+            None if debug else output_rels,
+            DEBUG_MACROS if debug else {},
+            compiled,
+            cache_dir,
+            jobs or default_jobs(),
+            in_process,
+            profile,
         )
 
         for output_rel in output_rels:
@@ -83,7 +444,149 @@ def execute_souffle(
                 logging.error(f"No data for {output_rel}")
                 continue
 
-            lines = path.read_text().splitlines()
-            output[output_rel] = [tuple(line.split("\t")) for line in lines]
+            reader = RelationReader(path, tmpdir)
+            output[output_rel] = reader if lazy else list(reader)
+    finally:
+        if not lazy:
+            tmpdir.cleanup()
 
     return output
+
+
+def _duration(node: Any) -> float:
+    """Get the duration of a souffle profile runtime entry
+    :param node: Entry with start and end times in microseconds
+    :returns: Duration in seconds, or 0 if the entry has no times
+    """
+    if isinstance(node, dict):
+        start = node.get("start")
+        end = node.get("end")
+
+        if isinstance(start, (int, float)) and isinstance(end, (int, float)):
+            return max(0, end - start) / 1e6
+
+    return 0
+
+
+def _count(node: Any) -> int:
+    """Get a tuple count of a souffle profile entry
+    :param node: Entry which may hold a num-tuples count
+    :returns: The count, or 0 if it has none
+    """
+    if isinstance(node, dict):
+        count = node.get("num-tuples")
+
+        if isinstance(count, (int, float)):
+            return int(count)
+
+    return 0
+
+
+def _mapping(node: Any, key: str, default: Any = None) -> Dict[str, Any]:
+    """Get a member of a souffle profile node which should be a mapping
+    :param node: Profile node
+    :param key: Key of the member
+    :param default: Value if the member is missing, by default empty
+    :returns: The member, or an empty mapping if it is not a mapping
+    """
+    value = node.get(key, default) if isinstance(node, dict) else default
+    return value if isinstance(value, dict) else {}
+
+
+def _entries(node: Any) -> Iterable[Any]:
+    """Get the entries of a profile node which is either a list or a mapping
+    :param node: Profile node
+    :returns: Entries of the node
+    """
+    if isinstance(node, dict):
+        return node.values()
+    elif isinstance(node, list):
+        return node
+    else:
+        return []
+
+
+def summarize_profile(path: Path, top: int = 25) -> Dict[str, Any]:
+    """Summarize the relations and rules that took the most time in a souffle
+        profile log. Entries of relations and rules that have an unexpected
+        shape are skipped rather than failing.
+    :param path: Path to a JSON profile log written by souffle --profile
+    :param top: Number of relations and rules to report
+    :returns: JSON-serializable summary, with the total runtime and the top
+        relations and rules by runtime
+    :raises ValueError: If the log does not have the layout of a souffle
+        profile log
+    """
+    log = json.loads(path.read_text())
+    root = _mapping(log, "root", log)
+
+    if not isinstance(root.get("program"), dict):
+        raise ValueError(f"{path} is not a souffle profile log")
+
+    program = root["program"]
+    relations = _mapping(program, "relation")
+
+    relation_summaries = []
+    rule_summaries = []
+
+    for (name, relation) in sorted(relations.items()):
+        if not isinstance(relation, dict):
+            continue
+
+        rules: Dict[Tuple[str, bool], List[float]] = {}
+
+        for (rule, entry) in _mapping(relation, "non-recursive-rule").items():
+            runtime = _duration(_mapping(entry, "runtime"))
+            rules[(rule, False)] = [runtime, _count(entry)]
+
+        iterations = list(_entries(relation.get("iteration")))
+        iteration_runtime = 0.0
+
+        for iteration in iterations:
+            if not isinstance(iteration, dict):
+                continue
+
+            iteration_runtime += _duration(iteration.get("runtime"))
+
+            recursive_rules = _mapping(iteration, "recursive-rule")
+
+            for (rule, versions) in recursive_rules.items():
+                totals = rules.setdefault((rule, True), [0.0, 0])
+
+                for version in _entries(versions):
+                    if isinstance(version, dict):
+                        totals[0] += _duration(version.get("runtime"))
+                        totals[1] += _count(version)
+
+        relation_summaries.append(
+            {
+                "relation": name,
+                "runtime": _duration(relation.get("runtime"))
+                or iteration_runtime,
+                "tuples": _count(relation),
+                "iterations": len(iterations),
+            }
+        )
+
+        for ((rule, recursive), (runtime, tuples)) in rules.items():
+            rule_summaries.append(
+                {
+                    "relation": name,
+                    "rule": rule,
+                    "recursive": recursive,
+                    "runtime": runtime,
+                    "tuples": int(tuples),
+                }
+            )
+
+    def by_runtime(summary: Dict[str, Any]) -> Tuple[float, str, str]:
+        return (
+            -summary["runtime"], summary["relation"], summary.get("rule", "")
+        )
+
+    return {
+        "runtime": _duration(program.get("runtime")),
+        "relation_count": len(relation_summaries),
+        "relations": sorted(relation_summaries, key=by_runtime)[:top],
+        "rules": sorted(rule_summaries, key=by_runtime)[:top],
+    }
@@ -0,0 +1,133 @@
+# Copyright (C) 2022 GrammaTech, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# This project is sponsored by the Office of Naval Research, One
+# Liberty Center, 875 N. Randolph Street, Arlington, VA 22203 under
+# contract #N68335-17-C-0700.  The content of the information does not
+# necessarily reflect the position or policy of the Government and no
+# official endorsement should be inferred.
+
+"""Record the baseline of benchmark_thresholds.json from benchmark runs.
+
+Run the synthetic benchmark several times on the machine that runs the nightly
+tests, appending the measured spans to a results file:
+
+    for run in 1 2 3 4 5; do
+        BENCHMARK_RESULTS=results.jsonl \\
+            pytest -m nightly tests/test_benchmark.py -k synthetic_stages
+    done
+
+Then record the median of each stage as the baseline:
+
+    python tests/record_benchmark_baseline.py results.jsonl
+
+The margins in benchmark_thresholds.json are kept, and the limit of each stage
+is its baseline times the margin's factor plus its slack. Wall times get a
+factor of 1.5 and two seconds of slack, since the nightly machine is shared and
+the shortest stages take well under a second. Peak memory does not depend on
+the load of the machine, so it gets a factor of 1.25 and 64MiB of slack.
+"""
+
+from ddisasm_retypd.version import __version__
+from pathlib import Path
+from typing import Any, Dict, List
+
+import argparse
+import collections
+import datetime
+import json
+import os
+import platform
+import statistics
+
+
+THRESHOLDS = Path(__file__).parent / "benchmark_thresholds.json"
+
+# Stages that are not part of ddisasm-retypd, and so have no baseline
+UNTRACKED_STAGES = {"disassemble"}
+
+
+def median_baseline(
+    runs: List[Dict[str, Any]], metrics: List[str]
+) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """Compute the median of each metric of each stage over several runs
+    :param runs: Runs of the benchmark, as written to $BENCHMARK_RESULTS
+    :param metrics: Metrics of the stages to record
+    :returns: Median of each size, stage and metric
+    """
+    samples = collections.defaultdict(list)
+
+    for run in runs:
+        spans = {stage["name"]: stage for stage in run["spans"]}
+
+        for (name, stage) in spans.items():
+            if name in UNTRACKED_STAGES:
+                continue
+
+            for metric in metrics:
+                if stage.get(metric) is not None:
+                    samples[(run["size"], name, metric)].append(stage[metric])
+
+    baseline = collections.defaultdict(lambda: collections.defaultdict(dict))
+
+    for ((size, name, metric), values) in sorted(samples.items()):
+        baseline[size][name][metric] = statistics.median(values)
+
+    return baseline
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Record the benchmark baseline from benchmark runs"
+    )
+    parser.add_argument(
+        "results",
+        type=Path,
+        help="JSON lines file of runs written to $BENCHMARK_RESULTS",
+    )
+    parser.add_argument(
+        "--thresholds",
+        type=Path,
+        default=THRESHOLDS,
+        help="Thresholds file to update",
+    )
+    args = parser.parse_args()
+
+    runs = [
+        json.loads(line)
+        for line in args.results.read_text().splitlines()
+        if line.strip()
+    ]
+    thresholds = json.loads(args.thresholds.read_text())
+    sizes = collections.Counter(run["size"] for run in runs)
+
+    thresholds["measured"] = {
+        "date": datetime.date.today().isoformat(),
+        "version": __version__,
+        "host": platform.node(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+        "runs": dict(sorted(sizes.items())),
+        "statistic": "median",
+    }
+    thresholds["baseline"] = median_baseline(
+        runs, sorted(thresholds["margin"])
+    )
+
+    args.thresholds.write_text(json.dumps(thresholds, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -79,6 +79,32 @@ def pytest_generate_tests(metafunc):
             metafunc.parametrize("ir,header", gtirb_loaded)
 
 
+@pytest.mark.commit
+def test_invalid_modules():
+    """Test that an IR without modules, or whose modules have different
+    address or register sizes, is rejected
+    """
+    with pytest.raises(ValueError):
+        DdisasmRetypd(gtirb.IR())()
+
+    ir = gtirb.IR()
+
+    for (name, isa) in (
+        ("main", gtirb.Module.ISA.X64),
+        ("lib", gtirb.Module.ISA.IA32),
+    ):
+        module = gtirb.Module(name=name, isa=isa, ir=ir)
+        for (aux_name, type_name) in (
+            ("functionEntries", "mapping<UUID,set<UUID>>"),
+            ("functionBlocks", "mapping<UUID,set<UUID>>"),
+            ("functionNames", "mapping<UUID,UUID>"),
+        ):
+            module.aux_data[aux_name] = gtirb.AuxData({}, type_name)
+
+    with pytest.raises(ValueError, match="main .* lib"):
+        DdisasmRetypd(ir)()
+
+
 @pytest.mark.nightly
 def test_derived_constraints(ir, header, tmp_path):
     """Verify that the constraints derived from retypd are valid"""
@@ -113,6 +139,41 @@ def test_derived_constraints(ir, header, tmp_path):
             )
 
 
+@pytest.mark.nightly
+@pytest.mark.parametrize(
+    "options, cached",
+    [
+        pytest.param({"jobs": 2, "parallel_solve": True}, [], id="parallel"),
+        pytest.param({"incremental": True}, ["solutions/*"], id="incremental"),
+        pytest.param(
+            {"fact_cache": "tar.gz", "cache_outputs": True},
+            ["facts/*.tar.gz", "outputs/*/*.csv"],
+            id="cached_souffle",
+        ),
+    ],
+)
+def test_solve_options(ir, header, tmp_path, options, cached):
+    """Verify that solving with each option derives the same constraints as
+    solving without it, including when reusing what it cached
+    :param options: Options of _solve_constraints to solve with
+    :param cached: Patterns of the files the options cache
+    """
+    dr = DdisasmRetypd(ir)
+    plain, _ = dr._solve_constraints(None, False)
+    expected = {str(dtv): str(c) for dtv, c in plain.items()}
+
+    # Solve a second time to reuse the cache, if anything was cached
+    for _ in range(2 if cached else 1):
+        derived, _ = dr._solve_constraints(
+            None, False, cache_dir=tmp_path, **options
+        )
+
+        assert {str(dtv): str(c) for dtv, c in derived.items()} == expected
+
+    for pattern in cached:
+        assert any(tmp_path.glob(pattern)), f"Nothing cached in {pattern}"
+
+
 @pytest.mark.nightly
 def test_correct_num_args(ir, header, tmp_path):
     """Validate that we get the number of arguments"""
@@ -0,0 +1,84 @@
+# Copyright (C) 2022 GrammaTech, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# This project is sponsored by the Office of Naval Research, One
+# Liberty Center, 875 N. Randolph Street, Arlington, VA 22203 under
+# contract #N68335-17-C-0700.  The content of the information does not
+# necessarily reflect the position or policy of the Government and no
+# official endorsement should be inferred.
+
+from ddisasm_retypd import ddisasm
+from ddisasm_retypd.batch import find_inputs, output_paths, run_batch
+from pathlib import Path
+
+import pytest
+
+
+GTIRB_DIR = Path(__file__).parent / "gtirb"
+
+
+@pytest.mark.commit
+def test_find_inputs_manifest(tmp_path):
+    """Test that manifests are read relative to their own directory"""
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text("# comment\na.gtirb\n\nsub/b.gtirb\n")
+
+    assert find_inputs(manifest) == [
+        tmp_path / "a.gtirb",
+        tmp_path / "sub" / "b.gtirb",
+    ]
+
+
+@pytest.mark.commit
+def test_output_paths(tmp_path):
+    """Test that inputs with the same name in different directories are
+    written to different paths
+    """
+    inputs = [tmp_path / "a" / "x.gtirb", tmp_path / "b" / "x.gtirb"]
+    dest_dir = tmp_path / "out"
+
+    assert output_paths(inputs, dest_dir) == [
+        dest_dir / "a" / "x.gtirb",
+        dest_dir / "b" / "x.gtirb",
+    ]
+    assert output_paths(inputs[:1], dest_dir) == [dest_dir / "x.gtirb"]
+
+
+@pytest.mark.nightly
+def test_batch(tmp_path):
+    """Test that every file of a batch is typed and summarized"""
+    inputs = find_inputs(GTIRB_DIR)[:2]
+    summaries = run_batch(inputs, tmp_path, workers=2)
+
+    assert [summary["input"] for summary in summaries] == [
+        str(source) for source in inputs
+    ]
+
+    for summary in summaries:
+        assert summary["status"] == "ok", summary.get("error")
+        assert Path(summary["output"]).exists()
+
+
+@pytest.mark.nightly
+def test_batch_parallel_decode(tmp_path, monkeypatch):
+    """Test that batch workers, which are daemonic, type files whose decoding
+    would otherwise be split across processes
+    """
+    monkeypatch.setattr(ddisasm, "PARALLEL_DECODE_MIN_BLOCKS", 0)
+    inputs = find_inputs(GTIRB_DIR)[:2]
+    summaries = run_batch(inputs, tmp_path, workers=2, jobs=2)
+
+    for summary in summaries:
+        assert summary["status"] == "ok", summary.get("error")
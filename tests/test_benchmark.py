@@ -0,0 +1,214 @@
+# Copyright (C) 2022 GrammaTech, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# This project is sponsored by the Office of Naval Research, One
+# Liberty Center, 875 N. Randolph Street, Arlington, VA 22203 under
+# contract #N68335-17-C-0700.  The content of the information does not
+# necessarily reflect the position or policy of the Government and no
+# official endorsement should be inferred.
+
+from ddisasm_retypd import DdisasmRetypd
+from ddisasm_retypd.ddisasm import (
+    extract_arch_relations,
+    extract_cfg_relations,
+    extract_module_souffle_relations,
+)
+from ddisasm_retypd.ddisasm_retypd import retype_file
+from ddisasm_retypd.instrument import span, tracing
+from ddisasm_retypd.souffle import default_jobs, execute_souffle
+from helpers import assembly_to_ddisasm
+from pathlib import Path
+from typing import List, Tuple
+
+import gtirb
+import json
+import os
+import pytest
+import time
+
+
+GTIRB_DIR = Path(__file__).parent / "gtirb"
+THRESHOLDS = Path(__file__).parent / "benchmark_thresholds.json"
+
+# Sizes of synthetic programs: (functions, call depth, blocks per function)
+SYNTHETIC_SIZES = {
+    "small": (16, 4, 4),
+    "medium": (64, 8, 8),
+    "large": (256, 8, 16),
+}
+
+
+def synthetic_assembly(
+    functions: int, depth: int, blocks: int
+) -> Tuple[str, List[str]]:
+    """Generate a program whose functions form call chains, with branching
+        blocks that load, store and compute on their arguments
+    :param functions: Number of functions
+    :param depth: Number of functions in each call chain
+    :param blocks: Number of blocks in each function
+    :returns: Assembly of the program and the names of its functions
+    """
+    names = [f"f{index}" for index in range(functions)]
+    lines = []
+
+    for (index, name) in enumerate(names):
+        lines += [
+            f"{name}:",
+            "    push RBX",
+            "    mov RBX, RDI",
+            "    mov RAX, QWORD PTR [RDI]",
+        ]
+
+        for block in range(blocks):
+            lines += [
+                "    cmp RAX, RSI",
+                f"    jge {name}_{block}",
+                "    add RAX, RSI",
+                f"    mov QWORD PTR [RBX+{8 * (block + 1)}], RAX",
+                f"{name}_{block}:",
+                f"    add RSI, {block + 1}",
+            ]
+
+        # Each function calls the next one, except the last of each chain
+        if (index + 1) % depth != 0 and index + 1 < functions:
+            lines += [
+                "    mov RDI, RBX",
+                "    mov RSI, RAX",
+                f"    call {names[index + 1]}",
+            ]
+
+        lines += ["    pop RBX", "    ret"]
+
+    return "\n".join(lines), names
+
+
+def _job_counts():
+    """Powers of two up to the number of available cores"""
+    counts = [1]
+
+    while counts[-1] * 2 <= default_jobs():
+        counts.append(counts[-1] * 2)
+
+    return counts
+
+
+@pytest.mark.nightly
+@pytest.mark.parametrize(
+    "gtirb_file",
+    sorted(GTIRB_DIR.glob("*.gtirb")),
+    ids=lambda path: path.name,
+)
+def test_souffle_jobs_scaling(gtirb_file, tmp_path):
+    """Benchmark souffle with increasing worker threads, and verify that the
+    generated constraints do not depend on the number of workers
+    """
+    module = gtirb.IR.load_protobuf(str(gtirb_file)).modules[0]
+    extract_module_souffle_relations(module, tmp_path)
+    extract_cfg_relations(module, tmp_path)
+    extract_arch_relations(module, tmp_path)
+
+    baseline = None
+    timings = []
+
+    for jobs in _job_counts():
+        start = time.perf_counter()
+        output = execute_souffle(
+            tmp_path,
+            DdisasmRetypd.DATALOG,
+            ["subtype_constraint"],
+            jobs=jobs,
+        )
+        timings.append((jobs, time.perf_counter() - start))
+
+        constraints = set(output["subtype_constraint"])
+
+        if baseline is None:
+            baseline = constraints
+
+        assert constraints == baseline, f"Output differs with {jobs} jobs"
+
+    print(gtirb_file.name)
+    for (jobs, elapsed) in timings:
+        speedup = timings[0][1] / elapsed
+        print(f"  jobs={jobs:<3} {elapsed:8.3f}s  x{speedup:.2f}")
+
+
+@pytest.mark.nightly
+@pytest.mark.parametrize("size", sorted(SYNTHETIC_SIZES))
+def test_synthetic_stages(size, tmp_path):
+    """Benchmark each stage of the pipeline on a synthetic program, and check
+    the time and memory of each stage against the baseline recorded in
+    benchmark_thresholds.json plus its margin. If $BENCHMARK_RESULTS is set,
+    the measured spans are appended to the JSON lines file it names, from
+    which record_benchmark_baseline.py records the baseline.
+    """
+    assembly, functions = synthetic_assembly(*SYNTHETIC_SIZES[size])
+    source = tmp_path / "synthetic.gtirb"
+    dest = tmp_path / "typed.gtirb"
+
+    with tracing() as tracer:
+        with span("disassemble"):
+            ir = assembly_to_ddisasm(
+                assembly, gtirb.Module.ISA.X64, functions
+            )
+
+        ir.save_protobuf(str(source))
+
+        with span("retype"):
+            types = retype_file(source, dest)
+
+    assert len(types) > 0
+
+    spans = {stage["name"]: stage for stage in tracer.spans}
+
+    print(size)
+    for (name, stage) in spans.items():
+        print(
+            f"  {name:<18} {stage['wall']:8.3f}s  cpu {stage['cpu']:8.3f}s"
+            f"  rss {stage['rss_kb']}KiB"
+            f"  peak +{stage['peak_rss_growth_kb']}KiB"
+        )
+
+    if "BENCHMARK_RESULTS" in os.environ:
+        with open(os.environ["BENCHMARK_RESULTS"], "a") as f:
+            f.write(json.dumps({"size": size, "spans": tracer.spans}) + "\n")
+
+    thresholds = json.loads(THRESHOLDS.read_text())
+    baseline = thresholds["baseline"].get(size)
+
+    if not baseline:
+        pytest.skip(
+            f"No baseline recorded for {size}, "
+            "see tests/record_benchmark_baseline.py"
+        )
+
+    failures = []
+
+    for (name, baselines) in baseline.items():
+        if name not in spans:
+            failures.append(f"{name}: not recorded")
+            continue
+
+        for (metric, base) in baselines.items():
+            margin = thresholds["margin"][metric]
+            limit = base * margin["factor"] + margin["slack"]
+            value = spans[name].get(metric)
+
+            if value is not None and value > limit:
+                failures.append(
+                    f"{name}: {metric} {value} > {limit} (baseline {base})"
+                )
+
+    assert not failures, f"Regressions on {size}: {failures}"
@@ -0,0 +1,96 @@
+# Copyright (C) 2022 GrammaTech, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# This project is sponsored by the Office of Naval Research, One
+# Liberty Center, 875 N. Randolph Street, Arlington, VA 22203 under
+# contract #N68335-17-C-0700.  The content of the information does not
+# necessarily reflect the position or policy of the Government and no
+# official endorsement should be inferred.
+
+from ddisasm_retypd.cache import (
+    FACT_CACHE_FORMATS,
+    load_facts,
+    load_outputs,
+    outputs_key,
+    store_facts,
+    store_outputs,
+)
+from ddisasm_retypd.souffle import RelationReader
+
+import pytest
+
+
+@pytest.mark.commit
+@pytest.mark.parametrize("fact_format", FACT_CACHE_FORMATS)
+def test_fact_cache(fact_format, tmp_path):
+    """Test that cached facts are copied into a facts directory only once
+    they have been stored, in each format
+    """
+    cache_dir = tmp_path / "cache"
+    facts = tmp_path / "facts"
+    loaded = tmp_path / "loaded"
+    facts.mkdir()
+    loaded.mkdir()
+
+    (facts / "instruction.facts").write_text("4096\t1\t\tRET\n")
+    (facts / "arch.pointer_size.facts").write_text("8")
+
+    assert not load_facts(cache_dir, "key", loaded, fact_format)
+
+    store_facts(cache_dir, "key", facts, fact_format)
+    store_facts(cache_dir, "key", facts, fact_format)
+
+    assert load_facts(cache_dir, "key", loaded, fact_format)
+    assert sorted(path.name for path in loaded.iterdir()) == [
+        "arch.pointer_size.facts",
+        "instruction.facts",
+    ]
+    assert (loaded / "instruction.facts").read_text() == "4096\t1\t\tRET\n"
+    assert not load_facts(cache_dir, "other", loaded, fact_format)
+
+
+@pytest.mark.commit
+def test_output_cache(tmp_path):
+    """Test that cached outputs are read back lazily from the cache, whether
+    they were stored from a relation reader or from rows, and that their key
+    depends on the facts and the relations output
+    """
+    datalog = tmp_path / "program.dl"
+    datalog.write_text(".decl a(x:number)\n")
+    key = outputs_key("facts", datalog, ["a", "b"])
+
+    assert key == outputs_key("facts", datalog, ["b", "a"])
+    assert key != outputs_key("facts", datalog, ["a"])
+    assert key != outputs_key("other", datalog, ["a", "b"])
+    assert load_outputs(tmp_path, key) is None
+
+    souffle_output = tmp_path / "b.csv"
+    souffle_output.write_text("x\t1\ny\t2\n")
+    outputs = store_outputs(
+        tmp_path,
+        key,
+        {"a": iter([("1",), ("2",)]), "b": RelationReader(souffle_output)},
+    )
+    souffle_output.unlink()
+
+    expected = {"a": [("1",), ("2",)], "b": [("x", "1"), ("y", "2")]}
+    assert {rel: list(rows) for (rel, rows) in outputs.items()} == expected
+
+    cached = load_outputs(tmp_path, key)
+    assert all(isinstance(rows, RelationReader) for rows in cached.values())
+    assert {rel: list(rows) for (rel, rows) in cached.items()} == expected
+
+    datalog.write_text(".decl a(x:number, y:number)\n")
+    assert key != outputs_key("facts", datalog, ["a", "b"])
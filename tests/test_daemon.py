@@ -0,0 +1,227 @@
+# Copyright (C) 2022 GrammaTech, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# This project is sponsored by the Office of Naval Research, One
+# Liberty Center, 875 N. Randolph Street, Arlington, VA 22203 under
+# contract #N68335-17-C-0700.  The content of the information does not
+# necessarily reflect the position or policy of the Government and no
+# official endorsement should be inferred.
+
+from ddisasm_retypd import daemon
+from typing import Iterator
+
+import contextlib
+import http.client
+import json
+import os
+import pytest
+import subprocess
+import threading
+import time
+
+
+def _slow_retype(source, dest, **kwargs):
+    """Stand-in for retype_file which takes a while"""
+    time.sleep(float(source.name))
+    dest.write_text("typed")
+    return {}
+
+
+@pytest.mark.commit
+def test_service_timeout(tmp_path, monkeypatch):
+    """Test that a request is killed and reported when it takes too long"""
+    monkeypatch.setattr(daemon, "retype_file", _slow_retype)
+    service = daemon.TypingService(1, 0, 30, {})
+
+    summary = service.submit(tmp_path / "0", tmp_path / "fast.gtirb")
+    assert summary["status"] == "ok"
+    assert (tmp_path / "fast.gtirb").read_text() == "typed"
+
+    with pytest.raises(TimeoutError):
+        service.submit(tmp_path / "30", tmp_path / "slow.gtirb", timeout=0.5)
+
+    assert not (tmp_path / "slow.gtirb").exists()
+    service.close()
+
+
+def _spawning_retype(source, dest, **kwargs):
+    """Stand-in for retype_file which starts a process and waits for it"""
+    process = subprocess.Popen(["sleep", "30"])
+    dest.write_text(str(process.pid))
+    process.wait()
+    return {}
+
+
+def _running(pid: int) -> bool:
+    """Whether a process is running, rather than exited or a zombie"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+@pytest.mark.commit
+def test_service_timeout_kills_children(tmp_path, monkeypatch):
+    """Test that the processes a request started are killed along with it
+    when it takes too long
+    """
+    monkeypatch.setattr(daemon, "retype_file", _spawning_retype)
+    service = daemon.TypingService(1, 0, 30, {})
+    pid_file = tmp_path / "pid"
+
+    with pytest.raises(TimeoutError):
+        service.submit(tmp_path / "input.gtirb", pid_file, timeout=1)
+
+    pid = int(pid_file.read_text())
+    deadline = time.monotonic() + 5
+
+    while _running(pid) and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    assert not _running(pid)
+    service.close()
+
+
+@pytest.mark.commit
+def test_service_queue_full(tmp_path, monkeypatch):
+    """Test that requests beyond the workers and queue are turned away"""
+    monkeypatch.setattr(daemon, "retype_file", _slow_retype)
+    service = daemon.TypingService(1, 0, 30, {})
+
+    running = threading.Thread(
+        target=service.submit, args=(tmp_path / "2", tmp_path / "a.gtirb")
+    )
+    running.start()
+
+    while service.status()["accepted"] == 0:
+        time.sleep(0.01)
+
+    with pytest.raises(daemon.QueueFull):
+        service.submit(tmp_path / "0", tmp_path / "b.gtirb")
+
+    running.join()
+    service.close()
+
+
+@contextlib.contextmanager
+def _serve(
+    service: daemon.TypingService,
+) -> Iterator[http.client.HTTPConnection]:
+    """Serve a typing service on a local port while in the context
+    :param service: Service to serve
+    :returns: Connection to the server
+    """
+    server = daemon.TypingHTTPServer(
+        ("127.0.0.1", 0), daemon.TypingRequestHandler
+    )
+    server.service = service
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    conn = http.client.HTTPConnection(*server.server_address)
+
+    try:
+        yield conn
+    finally:
+        conn.close()
+        server.shutdown()
+        server.server_close()
+        thread.join()
+        service.close()
+
+
+@pytest.mark.commit
+def test_bad_content_length():
+    """Test that a request with a malformed Content-Length is rejected"""
+    with _serve(daemon.TypingService(1, 0, 30, {})) as conn:
+        conn.putrequest("POST", "/type")
+        conn.putheader("Content-Length", "bad")
+        conn.endheaders()
+        response = conn.getresponse()
+
+        assert response.status == 400
+        assert "error" in json.loads(response.read())
+
+
+@pytest.mark.commit
+@pytest.mark.parametrize(
+    "header, member",
+    [
+        ("nan", None),
+        ("-1", None),
+        ("soon", None),
+        (None, float("inf")),
+        (None, -1),
+        (None, True),
+    ],
+)
+def test_bad_timeout(header, member, tmp_path, monkeypatch):
+    """Test that a request with a timeout which is not a finite, non-negative
+    number is rejected without typing anything
+    """
+    monkeypatch.setattr(daemon, "retype_file", _slow_retype)
+    request = {"input": str(tmp_path / "0"), "output": str(tmp_path / "out")}
+    headers = {"Content-Type": "application/json"}
+
+    if header is not None:
+        headers["X-Timeout"] = header
+    if member is not None:
+        request["timeout"] = member
+
+    with _serve(daemon.TypingService(1, 0, 30, {})) as conn:
+        conn.request("POST", "/type", json.dumps(request), headers)
+        response = conn.getresponse()
+
+        assert response.status == 400
+        assert "error" in json.loads(response.read())
+
+    assert not (tmp_path / "out").exists()
+
+
+@pytest.mark.commit
+def test_service_zero_timeout(tmp_path, monkeypatch):
+    """Test that a timeout of zero is not replaced by the default"""
+    monkeypatch.setattr(daemon, "retype_file", _slow_retype)
+    service = daemon.TypingService(1, 0, 30, {})
+
+    with pytest.raises(TimeoutError):
+        service.submit(tmp_path / "1", tmp_path / "out.gtirb", timeout=0)
+
+    service.close()
+
+
+def _parent_retype(source, dest, **kwargs):
+    """Stand-in for retype_file which records its parent process"""
+    dest.write_text(str(os.getppid()))
+    return {}
+
+
+@pytest.mark.commit
+def test_service_forks_from_supervisor(tmp_path, monkeypatch):
+    """Test that workers are forked from the supervisor rather than from the
+    threaded process serving requests
+    """
+    monkeypatch.setattr(daemon, "retype_file", _parent_retype)
+    service = daemon.TypingService(1, 0, 30, {})
+
+    summary = service.submit(tmp_path / "input.gtirb", tmp_path / "ppid")
+    assert summary["status"] == "ok"
+
+    ppid = int((tmp_path / "ppid").read_text())
+    assert ppid != os.getpid()
+    assert ppid == service._supervisor.pid
+
+    service.close()
+    assert not service._supervisor.is_alive()
@@ -0,0 +1,355 @@
+# Copyright (C) 2022 GrammaTech, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# This project is sponsored by the Office of Naval Research, One
+# Liberty Center, 875 N. Randolph Street, Arlington, VA 22203 under
+# contract #N68335-17-C-0700.  The content of the information does not
+# necessarily reflect the position or policy of the Government and no
+# official endorsement should be inferred.
+
+from ddisasm_retypd import ddisasm
+from helpers import assembly_to_gtirb
+from pathlib import Path
+from typing import List
+
+import gtirb
+import pytest
+import uuid
+
+
+ASSEMBLY = """
+x:
+    mov RAX, RSI
+    add RAX, RDI
+    ret
+y:
+    push RBX
+    mov RSI, 0
+    mov RDI, 0
+    call x
+    pop RBX
+    ret
+z:
+    call y
+    add EAX, 1
+    ret
+"""
+
+
+@pytest.mark.commit
+def test_parallel_instruction_relations(tmp_path, monkeypatch):
+    """Test that decoding instructions in multiple processes writes the same
+    facts, in the same order, as decoding them serially
+    """
+    ir = assembly_to_gtirb(ASSEMBLY, gtirb.Module.ISA.X64, ["x", "y", "z"])
+    monkeypatch.setattr(ddisasm, "PARALLEL_DECODE_MIN_BLOCKS", 0)
+
+    serial = tmp_path / "serial"
+    parallel = tmp_path / "parallel"
+    serial.mkdir()
+    parallel.mkdir()
+
+    module = ir.modules[0]
+    ddisasm.extract_instruction_relations(module, serial, jobs=1)
+    ddisasm.extract_instruction_relations(module, parallel, jobs=2)
+
+    for name in (
+        "block_instruction.facts",
+        "instruction_read_access.facts",
+        "instruction_write_access.facts",
+    ):
+        serial_text = (serial / name).read_text()
+        assert serial_text != ""
+        assert (parallel / name).read_text() == serial_text
+
+
+@pytest.mark.commit
+def test_fact_writer(tmp_path):
+    """Test that rows written through a FactWriter are all written, in order,
+    whether or not they fill its buffer
+    """
+    path = tmp_path / "rel.facts"
+    rows = [(i, f"R{i}") for i in range(5)]
+
+    with ddisasm.FactWriter(path, buffer_rows=2) as writer:
+        writer.write(rows[0])
+        writer.write_rows(rows[1:])
+
+    assert path.read_text().splitlines() == [f"{i}\tR{i}" for i in range(5)]
+
+
+def add_function(
+    module: gtirb.Module, section: str, address: int, name: str
+) -> gtirb.CodeBlock:
+    """Add a function of a single block to a module
+    :param module: Module to add the function to
+    :param section: Name of the section to add the function in
+    :param address: Address of the function
+    :param name: Name of the function
+    :returns: Block of the function
+    """
+    section = gtirb.Section(name=section, module=module)
+    byte_interval = gtirb.ByteInterval(
+        address=address, contents=b"\xc3", section=section
+    )
+    block = gtirb.CodeBlock(offset=0, size=1, byte_interval=byte_interval)
+    symbol = gtirb.Symbol(name, payload=block, module=module)
+
+    function = uuid.uuid4()
+    module.aux_data["functionEntries"].data[function] = {block}
+    module.aux_data["functionBlocks"].data[function] = {block}
+    module.aux_data["functionNames"].data[function] = symbol
+    return block
+
+
+@pytest.mark.commit
+def test_multi_module_names():
+    """Test that functions defined by several modules are given unique names,
+    and that a stub jumping to a symbol of another module is linked to the
+    function defining it
+    """
+    ir = gtirb.IR()
+    modules = []
+
+    for name in ("main", "lib"):
+        module = gtirb.Module(
+            name=name,
+            isa=gtirb.Module.ISA.X64,
+            file_format=gtirb.Module.FileFormat.ELF,
+            ir=ir,
+        )
+        for (aux_name, type_name) in (
+            ("functionEntries", "mapping<UUID,set<UUID>>"),
+            ("functionBlocks", "mapping<UUID,set<UUID>>"),
+            ("functionNames", "mapping<UUID,UUID>"),
+        ):
+            module.aux_data[aux_name] = gtirb.AuxData({}, type_name)
+        modules.append(module)
+
+    main = add_function(modules[0], ".text", 0x1000, "main")
+    add_function(modules[0], ".text", 0x1010, "init")
+    stub = add_function(modules[0], ".plt", 0x2000, "puts@plt")
+    add_function(modules[1], ".text", 0x1000, "puts")
+    add_function(modules[1], ".text", 0x1010, "init")
+
+    proxy = gtirb.ProxyBlock(module=modules[0])
+    gtirb.Symbol("puts", payload=proxy, module=modules[0])
+    ir.cfg.add(gtirb.Edge(main, stub, gtirb.Edge.Label(gtirb.Edge.Type.Call)))
+    ir.cfg.add(
+        gtirb.Edge(stub, proxy, gtirb.Edge.Label(gtirb.Edge.Type.Branch))
+    )
+
+    names = ddisasm.get_function_names(ir)
+    assert names[0]["init"] == "main:init"
+    assert names[1]["init"] == "lib:init"
+    assert names[0]["main"] == "main"
+    assert names[1]["puts"] == "puts"
+
+    links = ddisasm.get_stub_links(ir, names)
+    assert links == [{"puts@plt": "puts", "FUN_8192": "puts"}, {}]
+
+    assert ddisasm.get_callgraph(ir, names, links) == {
+        "main": {"puts"},
+        "main:init": set(),
+        "puts": set(),
+        "lib:init": set(),
+    }
+
+
+@pytest.mark.commit
+def test_facts_instruction_relations(tmp_path, monkeypatch):
+    """Test that instruction facts are built from the instructions and
+    register accesses ddisasm exported, and that they are not written if an
+    instruction of a block is missing from them
+    """
+    module = gtirb.Module(
+        name="main",
+        isa=gtirb.Module.ISA.X64,
+        file_format=gtirb.Module.FileFormat.ELF,
+    )
+    section = gtirb.Section(name=".text", module=module)
+    byte_interval = gtirb.ByteInterval(
+        address=0x1000, contents=b"\x50\x89\xc3\xc3", section=section
+    )
+    gtirb.CodeBlock(offset=0, size=3, byte_interval=byte_interval)
+    gtirb.CodeBlock(offset=3, size=1, byte_interval=byte_interval)
+
+    # The overlapping instruction at 0x1002 is not in any block
+    (tmp_path / "instruction.facts").write_text(
+        "4096\t1\t\tPUSH\n4097\t2\t\tMOV\n4098\t1\t\tRET\n4099\t1\t\tRET\n"
+    )
+    (tmp_path / "register_access.facts").write_text(
+        "4096\tR\tRAX\n4096\tW\tRSP\n4097\tR\tEAX\n4097\tW\tEBX\n"
+        "4098\tR\tRSP\n4099\tR\tRSP\n"
+    )
+
+    assert ddisasm.extract_facts_instruction_relations(module, tmp_path)
+    assert (tmp_path / "block_instruction.facts").read_text().split() == [
+        "4096",
+        "4096",
+        "4097",
+        "4096",
+        "4099",
+        "4099",
+    ]
+    assert (tmp_path / "instruction_read_access.facts").read_text().split(
+        "\n"
+    ) == ["4096\tRAX", "4097\tEAX", "4099\tRSP", ""]
+    assert (tmp_path / "instruction_write_access.facts").read_text().split(
+        "\n"
+    ) == ["4096\tRSP", "4097\tEBX", ""]
+
+    # Accesses to registers the datalog does not track, such as RIP-relative
+    # and SSE accesses, are kept for the datalog to filter out
+    (tmp_path / "register_access.facts").write_text(
+        "4096\tR\tRAX\n4097\tR\tRIP\n4097\tW\tXMM0\n4099\tR\tFS\n"
+    )
+
+    def decode(*args):
+        raise AssertionError("Instructions were decoded")
+
+    monkeypatch.setattr(ddisasm, "extract_instruction_relations", decode)
+    ddisasm.extract_cfg_relations(module, tmp_path)
+    monkeypatch.undo()
+    assert (tmp_path / "instruction_read_access.facts").read_text().split(
+        "\n"
+    ) == ["4096\tRAX", "4097\tRIP", "4099\tFS", ""]
+    assert (tmp_path / "instruction_write_access.facts").read_text().split(
+        "\n"
+    ) == ["4097\tXMM0", ""]
+
+    # Accesses with the columns swapped, or missing a column, are not trusted
+    for access in ("4096\tRSP\tW\n", "4096\tR\n"):
+        (tmp_path / "register_access.facts").write_text(access)
+        assert not ddisasm.extract_facts_instruction_relations(
+            module, tmp_path
+        )
+
+    # Facts are read alongside the blocks, so they must be sorted by address
+    (tmp_path / "register_access.facts").write_text(
+        "4097\tR\tEAX\n4096\tR\tRAX\n"
+    )
+    assert not ddisasm.extract_facts_instruction_relations(module, tmp_path)
+
+    (tmp_path / "register_access.facts").write_text("4096\tR\tRAX\n")
+    (tmp_path / "instruction.facts").write_text("4096\t1\t\tPUSH\n")
+    assert not ddisasm.extract_facts_instruction_relations(module, tmp_path)
+
+
+@pytest.mark.commit
+def test_souffle_relations(tmp_path):
+    """Test that ddisasm's facts are written from an IR, which are those of
+    its first module, or from a module
+    """
+    ir = gtirb.IR()
+
+    for (index, name) in enumerate(("main", "lib")):
+        module = gtirb.Module(name=name, ir=ir)
+
+        for aux in ddisasm.FACT_AUX_DATA:
+            module.aux_data[aux] = gtirb.AuxData(
+                {f"{aux}_{name}": ("", f"{index}\n")},
+                "mapping<string,tuple<string,string>>",
+            )
+
+    ddisasm.extract_souffle_relations(ir, tmp_path)
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "souffleFacts_main.facts",
+        "souffleOutputs_main.facts",
+    ]
+
+    ddisasm.extract_module_souffle_relations(ir.modules[1], tmp_path)
+    assert (tmp_path / "souffleFacts_lib.facts").read_text() == "1\n"
+
+
+@pytest.mark.commit
+def test_facts_key():
+    """Test that the facts key of a module changes with its code and
+    ddisasm's facts, but not with AuxData extraction does not read
+    """
+    module = gtirb.Module(
+        name="main",
+        isa=gtirb.Module.ISA.X64,
+        file_format=gtirb.Module.FileFormat.ELF,
+    )
+    section = gtirb.Section(name=".text", module=module)
+    byte_interval = gtirb.ByteInterval(
+        address=0x1000, contents=b"\xc3", section=section
+    )
+    gtirb.CodeBlock(offset=0, size=1, byte_interval=byte_interval)
+    module.aux_data["souffleFacts"] = gtirb.AuxData(
+        {"instruction": ("", "4096\t1\t\tRET\n")},
+        "mapping<string,tuple<string,string>>",
+    )
+    key = ddisasm.facts_key(module)
+
+    module.aux_data["comments"] = gtirb.AuxData({}, "mapping<Offset,string>")
+    assert ddisasm.facts_key(module) == key
+
+    byte_interval.contents[0] = 0x90
+    assert ddisasm.facts_key(module) != key
+
+    # The key does not depend on the order of the relations
+    byte_interval.contents[0] = 0xC3
+    module.aux_data["souffleFacts"].data["block"] = ("", "4096\n")
+    key = ddisasm.facts_key(module)
+    module.aux_data["souffleFacts"] = gtirb.AuxData(
+        {"block": ("", "4096\n"), "instruction": ("", "4096\t1\t\tRET\n")},
+        "mapping<string,tuple<string,string>>",
+    )
+    assert ddisasm.facts_key(module) == key
+
+    module.aux_data["souffleFacts"].data["instruction"] = ("", "")
+    assert ddisasm.facts_key(module) != key
+
+
+def _module_calling(names: List[str]) -> gtirb.Module:
+    """Build a module with a block calling a proxy block, which has symbols
+    added in the given order
+    :param names: Names of the symbols of the proxy block
+    :returns: The module
+    """
+    ir = gtirb.IR()
+    module = gtirb.Module(name="main", isa=gtirb.Module.ISA.X64, ir=ir)
+    section = gtirb.Section(name=".text", module=module)
+    byte_interval = gtirb.ByteInterval(
+        address=0x1000, contents=b"\xe8\x00\x00\x00\x00", section=section
+    )
+    block = gtirb.CodeBlock(offset=0, size=5, byte_interval=byte_interval)
+    proxy = gtirb.ProxyBlock(module=module)
+
+    for name in names:
+        gtirb.Symbol(name, payload=proxy, module=module)
+
+    ir.cfg.add(
+        gtirb.Edge(
+            block, proxy, gtirb.Edge.Label(type=gtirb.Edge.Type.Call)
+        )
+    )
+    return module
+
+
+@pytest.mark.commit
+def test_facts_key_stable(tmp_path, monkeypatch):
+    """Test that the facts key does not depend on the order of the symbols of
+    a proxy block, and that it changes with the extraction code
+    """
+    key = ddisasm.facts_key(_module_calling(["puts", "puts@GLIBC"]))
+    assert ddisasm.facts_key(_module_calling(["puts@GLIBC", "puts"])) == key
+
+    source = tmp_path / "ddisasm.py"
+    source.write_text(Path(ddisasm.__file__).read_text() + "\n# changed\n")
+    monkeypatch.setattr(ddisasm, "__file__", str(source))
+    assert ddisasm.facts_key(_module_calling(["puts", "puts@GLIBC"])) != key
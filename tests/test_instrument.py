@@ -0,0 +1,78 @@
+# Copyright (C) 2022 GrammaTech, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# This project is sponsored by the Office of Naval Research, One
+# Liberty Center, 875 N. Randolph Street, Arlington, VA 22203 under
+# contract #N68335-17-C-0700.  The content of the information does not
+# necessarily reflect the position or policy of the Government and no
+# official endorsement should be inferred.
+
+from ddisasm_retypd.instrument import Tracer, span, tracing
+
+import json
+import pytest
+import resource
+
+
+@pytest.mark.commit
+def test_tracing_spans(tmp_path):
+    """Test that nested spans are recorded with their parents and counts, and
+    written in both trace formats
+    """
+    with tracing() as tracer:
+        with span("outer"):
+            with span("inner") as counts:
+                counts["rows"] = 3
+
+    # Spans outside of a tracing context are not recorded
+    with span("untraced"):
+        pass
+
+    spans = tracer.to_json()["spans"]
+    assert [s["name"] for s in spans] == ["outer", "inner"]
+    assert spans[1]["parent"] == "outer"
+    assert spans[1]["counts"] == {"rows": 3}
+    assert spans[0]["wall"] >= spans[1]["wall"]
+
+    tracer.write(tmp_path / "trace.json", "chrome")
+    events = json.loads((tmp_path / "trace.json").read_text())["traceEvents"]
+    assert {event["name"] for event in events} == {"outer", "inner"}
+    assert all(event["ph"] == "X" for event in events)
+
+    with pytest.raises(ValueError):
+        Tracer().write(tmp_path / "trace.txt", "text")
+
+
+@pytest.mark.commit
+def test_span_memory():
+    """Test that the memory of a span is how much it raised the peak RSS,
+    rather than the peak over the life of the process
+    """
+    size = 256 * 1024 * 1024
+
+    with tracing() as tracer:
+        with span("allocate"):
+            data = b"x" * size
+        del data
+
+        with span("idle"):
+            pass
+
+    spans = {s["name"]: s for s in tracer.spans}
+    assert spans["allocate"]["peak_rss_growth_kb"] >= size // 2048
+    assert spans["idle"]["peak_rss_growth_kb"] == 0
+    assert spans["idle"]["rss_kb"] < (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    )
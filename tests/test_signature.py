@@ -15,8 +15,8 @@ x:
 )
 def test_return_value_simple(result):
     """Test that return values are recovered correctly"""
-    result.assertContains("writes_direct_return_value", ("x", 0x4000))
-    result.assertContains("writes_return_value", ("x", 0x4000))
+    result.assertContains("writes_direct_return_value_by_name", ("x", 0x4000))
+    result.assertContains("writes_return_value_by_name", ("x", 0x4000))
 
 
 @pytest.mark.commit
@@ -39,13 +39,15 @@ br_done:
 def test_return_value_branch(result):
     """Test that return values are recovered correctly"""
     # Unreachable write to the return register
-    result.assertNotContains("writes_direct_return_value", ("x", 0x4000))
+    result.assertNotContains(
+        "writes_direct_return_value_by_name", ("x", 0x4000)
+    )
 
     # Reachable writes to the return register
-    result.assertContains("writes_direct_return_value", ("x", 0x4009))
-    result.assertContains("writes_direct_return_value", ("x", 0x4010))
-    result.assertContains("writes_return_value", ("x", 0x4009))
-    result.assertContains("writes_return_value", ("x", 0x4010))
+    result.assertContains("writes_direct_return_value_by_name", ("x", 0x4009))
+    result.assertContains("writes_direct_return_value_by_name", ("x", 0x4010))
+    result.assertContains("writes_return_value_by_name", ("x", 0x4009))
+    result.assertContains("writes_return_value_by_name", ("x", 0x4010))
 
 
 @pytest.mark.commit
@@ -69,16 +71,20 @@ def test_return_implicit(result):
     """Test that implicit return values are calculated correctly and that reads
     to them are detected as well
     """
-    result.assertContains("writes_return_value", ("x", 0x4000))
-    result.assertContains("call_graph", ("y", "x"))
-    result.assertNotContains("writes_direct_return_value", ("y", None))
-    result.assertContains("may_pass_implicit_return_value", ("y", "x", 0x4000))
+    result.assertContains("writes_return_value_by_name", ("x", 0x4000))
+    result.assertContains("call_graph_by_name", ("y", "x"))
+    result.assertNotContains("writes_direct_return_value_by_name", ("y", None))
+    result.assertContains(
+        "may_pass_implicit_return_value_by_name", ("y", "x", 0x4000)
+    )
 
     # XXX: ddisasm appears to parse after the call as a separate function?
     result.assertContains(
-        "reads_return_value", ("z", "FUN_16401", 0x4011, "RAX")
+        "reads_return_value_by_name", ("z", "FUN_16401", 0x4011, "RAX")
+    )
+    result.assertContains(
+        "writes_direct_return_value_by_name", ("FUN_16401", 0x4011)
     )
-    result.assertContains("writes_direct_return_value", ("FUN_16401", 0x4011))
 
 
 @pytest.mark.commit
@@ -100,7 +106,55 @@ def test_return_implicit(result):
 )
 def test_return_reads_direct(result):
     """Test that return value reads are calculated correctly"""
-    result.assertContains("reads_return_value", ("y", "x", 0x400B, "RAX"))
+    result.assertContains(
+        "reads_return_value_by_name", ("y", "x", 0x400B, "RAX")
+    )
+
+
+@pytest.mark.commit
+@table_test(
+    """
+    x:
+    mov EAX, 1
+    ret
+
+    y:
+    call x
+    mov EBX, EAX
+    call x
+    add EBX, EAX
+    mov EAX, EBX
+    add EAX, 1
+    ret
+    """,
+    gtirb.Module.ISA.X64,
+    functions=["x", "y"],
+)
+def test_return_reads_killed(result):
+    """Test that the return value defined by a call is killed by a later call
+    and by a later write, as it was when calls were definitions in a second
+    def-use analysis
+    """
+    result.assertContains(
+        "call_return_def_use",
+        (0x4006, "RAX", 0x400B),
+        (0x400D, "RAX", 0x4012),
+    )
+    result.assertNotContains(
+        "call_return_def_use",
+        (0x4006, "RAX", 0x4012),
+        (0x4006, "RAX", 0x4016),
+        (0x400D, "RAX", 0x4016),
+    )
+
+    result.assertContains(
+        "reads_return_value_by_name",
+        ("y", "x", 0x400B, "RAX"),
+        ("y", "x", 0x4012, "RAX"),
+    )
+    result.assertNotContains(
+        "reads_return_value_by_name", ("y", "x", 0x4016, "RAX")
+    )
 
 
 @pytest.mark.commit
@@ -133,6 +187,98 @@ def test_reaches_without_write(result):
     )
 
 
+@pytest.mark.commit
+@table_test(
+    """
+x:
+    cmp     EDI, ESI
+    mov     EAX, 0
+    jle     br_true
+    mov     EDX, 1
+    jmp     br_done
+br_true:
+    mov     ECX, 2
+br_done:
+    ret
+    """,
+    gtirb.Module.ISA.X64,
+    functions=["x"],
+)
+def test_reaches_without_write_branch(result):
+    """Test that reaches_without_write is resolved within a block which writes
+    to a register after its start, and across the edges of a branch, the same
+    as it was when computed per instruction
+    """
+    result.assertContains(
+        "reaches_without_write",
+        # RAX is written in the middle of the entry block
+        (0x4000, "RAX"),
+        (0x4002, "RAX"),
+        # RDX is only written on the fallthrough path
+        (0x4009, "RDX"),
+        (0x4010, "RDX"),
+        (0x4015, "RDX"),
+        # RCX is only written on the branch path
+        (0x4009, "RCX"),
+        (0x400E, "RCX"),
+        (0x4010, "RCX"),
+        (0x4015, "RCX"),
+        (0x4015, "RDI"),
+    )
+    result.assertNotContains(
+        "reaches_without_write",
+        (0x4007, "RAX"),
+        (0x4009, "RAX"),
+        (0x4010, "RAX"),
+        (0x4015, "RAX"),
+        (0x400E, "RDX"),
+    )
+
+
+@pytest.mark.commit
+@table_test(
+    """
+x:
+    mov     EAX, 0
+    cmp     EDI, ESI
+    jle     br_true
+    mov     EAX, 1
+    jmp     br_done
+br_true:
+    mov     ECX, 2
+br_done:
+    add     EAX, 1
+    mov     EBX, EAX
+    ret
+    """,
+    gtirb.Module.ISA.X64,
+    functions=["x"],
+)
+def test_def_use_branch(result):
+    """Test that register definitions reach their uses along either path of a
+    branch, and are killed by later definitions
+    """
+
+    def def_use(ea_def, reg, ea_use):
+        return (
+            ea_use,
+            f"def_use(From={ea_def}, Reg={reg}, To={ea_use})",
+            "def-use",
+        )
+
+    result.assertContains(
+        "comment",
+        def_use(0x4000, "RAX", 0x4015),
+        def_use(0x4009, "RAX", 0x4015),
+        def_use(0x4015, "RAX", 0x4018),
+    )
+    result.assertNotContains(
+        "comment",
+        def_use(0x4000, "RAX", 0x4018),
+        def_use(0x4009, "RAX", 0x4018),
+    )
+
+
 @pytest.mark.commit
 @table_test(
     """
@@ -155,13 +301,13 @@ def test_basic_arguments(result):
     can be computed correctly
     """
     result.assertContains(
-        "writes_argument_before_call",
+        "writes_argument_before_call_by_name",
         ("y", 0x400E, "RDI", "x", 1),
         ("y", 0x4007, "RSI", "x", 2),
     )
 
     result.assertContains(
-        "reads_unwritten_argument",
+        "reads_unwritten_argument_by_name",
         ("x", 0x4000, "RSI", 2),
         ("x", 0x4003, "RDI", 1),
     )
@@ -193,7 +339,73 @@ def test_implicit_arguments(result):
     computed correctly
     """
     result.assertContains(
-        "writes_implicit_argument",
+        "writes_implicit_argument_by_name",
         ("z", 0x400D, "y", "x", 0x4000, 2),
         ("z", 0x4014, "y", "x", 0x4003, 1),
     )
+
+
+@pytest.mark.commit
+@table_test(
+    """
+    x:
+    mov RAX, RSI
+    add RAX, RDI
+    ret
+
+    y:
+    call x
+    ret
+
+    z:
+    mov RSI, 0
+    mov RDI, 0
+    call y
+    ret
+
+    w:
+    call x
+    mov RSI, 0
+    call y
+    ret
+    """,
+    gtirb.Module.ISA.X64,
+    functions=["x", "y", "z", "w"],
+)
+def test_call_reaches_with(result):
+    """Test that call_reaches_with gives the same tuples for the queried pairs
+    as it did when computed for every pair of functions
+    """
+    # Every call path from z to x passes through y
+    result.assertContains("call_reaches_with_by_name", ("z", "y", "x"))
+
+    # w also calls x directly, and y does not reach itself
+    result.assertNotContains(
+        "call_reaches_with_by_name",
+        ("w", "y", "x"),
+        ("z", "y", "y"),
+    )
+    result.assertNotContains(
+        "writes_implicit_argument_by_name", ("w", None, "y", "x", None, None)
+    )
+
+
+@pytest.mark.commit
+@table_test(
+    """
+    x:
+    x.alias:
+    mov RAX, qword ptr [RDI]
+    ret
+    """,
+    gtirb.Module.ISA.X64,
+    functions=["x", "x.alias"],
+)
+def test_filter_name_aliases(result):
+    """Test that every name of a function entry is given its constraints, as
+    when functions were identified by name
+    """
+    result.assertContains("filter_name", (0x4000, "x"), (0x4000, "FUN_16384"))
+
+    names = {func for func, *_ in result.results["subtype_constraint"]}
+    assert {"x", "FUN_16384"} <= names
@@ -0,0 +1,199 @@
+# Copyright (C) 2022 GrammaTech, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# This project is sponsored by the Office of Naval Research, One
+# Liberty Center, 875 N. Randolph Street, Arlington, VA 22203 under
+# contract #N68335-17-C-0700.  The content of the information does not
+# necessarily reflect the position or policy of the Government and no
+# official endorsement should be inferred.
+
+from ddisasm_retypd import souffle
+from ddisasm_retypd.souffle import (
+    RelationReader,
+    datalog_hash,
+    load_souffle_module,
+    summarize_profile,
+)
+from pathlib import Path
+
+import json
+import pytest
+import shutil
+import subprocess
+
+
+@pytest.mark.commit
+def test_relation_reader(tmp_path):
+    """Test that a relation reader parses rows each time it is iterated"""
+    path = tmp_path / "rel.csv"
+    path.write_text("x\t16384\tRAX\ny\t16400\tRDI\n")
+
+    reader = RelationReader(path)
+    expected = [("x", "16384", "RAX"), ("y", "16400", "RDI")]
+
+    assert list(reader) == expected
+    assert list(reader) == expected
+
+
+@pytest.mark.commit
+def test_load_souffle_modules(tmp_path, monkeypatch):
+    """Test that SWIG builds of different programs loaded into one process
+    each use their own native library
+    """
+    monkeypatch.setattr(souffle, "_find_souffle", lambda: Path("souffle"))
+    monkeypatch.setattr(souffle, "_souffle_version", lambda path: "test")
+    cache_dir = tmp_path / "cache"
+    datalogs = []
+
+    for name in ["first", "second"]:
+        datalog = tmp_path / name / "program.dl"
+        datalog.parent.mkdir()
+        datalog.write_text(f".decl {name}(x:number)\n")
+        datalogs.append(datalog)
+
+        # Stand-ins for the wrapper and native library generated by SWIG,
+        # which always have these names
+        entry_dir = cache_dir / f"{datalog_hash(datalog, {}, 'test')}-python"
+        entry_dir.mkdir(parents=True)
+        (entry_dir / "_SwigInterface.py").write_text(f"NAME = {name!r}\n")
+        (entry_dir / "SwigInterface.py").write_text(
+            "from . import _SwigInterface\n"
+            "\n"
+            "def newInstance(name):\n"
+            "    return _SwigInterface.NAME\n"
+        )
+
+    modules = [
+        load_souffle_module(datalog, {}, cache_dir) for datalog in datalogs
+    ]
+
+    assert [module.newInstance("program") for module in modules] == [
+        "first",
+        "second",
+    ]
+    assert load_souffle_module(datalogs[0], {}, cache_dir) is modules[0]
+
+
+@pytest.mark.commit
+def test_summarize_profile(tmp_path):
+    """Test that relations and rules are ranked by runtime, with recursive
+    rules totalled over iterations, and that unexpected entries are skipped
+    """
+    profile = {
+        "root": {
+            "program": {
+                "runtime": {"start": 0, "end": 5000000},
+                "relation": {
+                    "fast": {
+                        "runtime": {"start": 0, "end": 1000},
+                        "num-tuples": 3,
+                        "non-recursive-rule": {
+                            "fast(x) :- a(x).": {
+                                "runtime": {"start": 0, "end": 1000},
+                                "num-tuples": 3,
+                            }
+                        },
+                    },
+                    "slow": {
+                        "num-tuples": 100,
+                        "iteration": [
+                            {
+                                "runtime": {"start": 0, "end": 2000000},
+                                "recursive-rule": {
+                                    "slow(x) :- slow(y), b(x, y).": {
+                                        "0": {
+                                            "runtime": {
+                                                "start": 0,
+                                                "end": 1500000,
+                                            },
+                                            "num-tuples": 60,
+                                        }
+                                    }
+                                },
+                            },
+                            {
+                                "runtime": {"start": 0, "end": 1000000},
+                                "recursive-rule": {
+                                    "slow(x) :- slow(y), b(x, y).": {
+                                        "0": {
+                                            "runtime": {
+                                                "start": 0,
+                                                "end": 500000,
+                                            },
+                                            "num-tuples": 40,
+                                        }
+                                    }
+                                },
+                            },
+                        ],
+                    },
+                    "broken": "unexpected",
+                },
+            }
+        }
+    }
+    path = tmp_path / "profile.json"
+    path.write_text(json.dumps(profile))
+
+    summary = summarize_profile(path)
+
+    assert summary["runtime"] == 5
+    assert [r["relation"] for r in summary["relations"]] == ["slow", "fast"]
+    assert summary["relations"][0]["runtime"] == 3
+    assert summary["relations"][0]["iterations"] == 2
+
+    rule = summary["rules"][0]
+    assert rule["relation"] == "slow"
+    assert rule["recursive"]
+    assert rule["runtime"] == 2
+    assert rule["tuples"] == 100
+
+    path.write_text(json.dumps({"root": {"configuration": {}}}))
+
+    with pytest.raises(ValueError):
+        summarize_profile(path)
+
+
+@pytest.mark.nightly
+@pytest.mark.skipif(
+    shutil.which("souffle") is None, reason="souffle is not installed"
+)
+def test_summarize_souffle_profile(tmp_path):
+    """Test that the profile log of a real souffle run is summarized"""
+    datalog = tmp_path / "path.dl"
+    datalog.write_text(
+        """
+.decl edge(x:number, y:number)
+edge(1, 2). edge(2, 3). edge(3, 4).
+
+.decl path(x:number, y:number)
+.output path
+path(x, y) :- edge(x, y).
+path(x, z) :- path(x, y), edge(y, z).
+"""
+    )
+    path = tmp_path / "profile.json"
+    subprocess.run(
+        ["souffle", f"--profile={path}", "-D", str(tmp_path), str(datalog)],
+        check=True,
+    )
+
+    summary = summarize_profile(path)
+
+    assert "path" in {r["relation"] for r in summary["relations"]}
+    assert any(
+        rule["relation"] == "path" and rule["recursive"]
+        for rule in summary["rules"]
+    )